@@ -0,0 +1,312 @@
+# 无界面性能基准: 在生成的合成数据集上测量主界面的关键路径, 结果写入 JSON 便于在提交之间比较
+# python benchmarks/bench_viewer.py --out bench.json [--compare old.json]
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+# 必须在导入 Qt 之前设置
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+# ------------------------ Dataset ------------------------ #
+def make_image(np, width, height, seed):
+    # 平滑的渐变加噪声, 各方法之间只有少量差异, 压缩率接近真实图像
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = np.stack([x / width * 255, y / height * 255, (x + y) / (width + height) * 255], axis=2)
+    base += rng.normal(0, 8, base.shape).astype(np.float32)
+    return np.clip(base, 0, 255).astype(np.uint8)
+
+
+def make_dataset(root, folders, count, width, height, fmt):
+    # 已生成过相同参数的数据集时直接复用
+    import numpy as np
+    import cv2
+    name = f"{folders}x{count}_{width}x{height}_{fmt}"
+    dataset = os.path.join(root, name)
+    dirs = [os.path.join(dataset, f"m{i}") for i in range(folders)]
+    if all(os.path.isdir(d) and len(os.listdir(d)) == count for d in dirs):
+        return dirs
+    gt = [make_image(np, width, height, k) for k in range(min(count, 8))]
+    for i, directory in enumerate(dirs):
+        os.makedirs(directory, exist_ok=True)
+        rng = np.random.default_rng(1000 + i)
+        for k in range(count):
+            img = gt[k % len(gt)]
+            if i > 0:
+                noise = rng.normal(0, 2 * i, img.shape).astype(np.int16)
+                img = np.clip(img + noise, 0, 255).astype(np.uint8)
+            cv2.imwrite(os.path.join(directory, f"{k:06d}.{fmt}"), img)
+    return dirs
+
+
+def make_listing(root, folders, count):
+    # 只测试列表读取, 空文件即可
+    dataset = os.path.join(root, f"list_{folders}x{count}")
+    dirs = [os.path.join(dataset, f"m{i}") for i in range(folders)]
+    for directory in dirs:
+        if os.path.isdir(directory) and len(os.listdir(directory)) == count:
+            continue
+        os.makedirs(directory, exist_ok=True)
+        for k in range(count):
+            open(os.path.join(directory, f"{k:06d}.png"), 'wb').close()
+    return dirs
+
+
+# ------------------------ Measure ------------------------ #
+def peak_rss_mb():
+    # Linux 下 ru_maxrss 以 KB 为单位, macOS 以字节为单位
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 / 1024 if sys.platform == 'darwin' else rss / 1024
+
+
+def summarize(samples, started):
+    # samples: 每次操作的耗时 (秒)
+    elapsed = time.perf_counter() - started
+    ordered = sorted(samples)
+
+    def percentile(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+
+    return {
+        'count': len(samples),
+        'p50_ms': percentile(0.5),
+        'p95_ms': percentile(0.95),
+        'mean_ms': sum(samples) / len(samples) * 1000,
+        'throughput_per_s': len(samples) / elapsed if elapsed > 0 else 0.0,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+class Bench:
+    def __init__(self, app, window_size=(1920, 1080), timeout=30.0):
+        self.app = app
+        self.window_size = window_size
+        self.timeout = timeout
+
+    def pump_until(self, done):
+        end = time.perf_counter() + self.timeout
+        while not done():
+            if time.perf_counter() > end:
+                raise TimeoutError('benchmark step timed out')
+            self.app.processEvents()
+            time.sleep(0.0005)
+
+    def open_viewer(self, dirs):
+        from main import MainUI
+        ui = MainUI(dirs, restore=False)
+        # 面板大小在第一次加载时固定, 需在读取文件夹之前设置窗口大小
+        ui.showNormal()
+        ui.resize(*self.window_size)
+        self.pump_until(lambda: ui.current_index is not None and not ui.pending_panels)
+        return ui
+
+    def bench_read_list(self, dirs):
+        # 冷启动 (扫描目录) 与热启动 (读取磁盘索引缓存) 分别统计
+        from main import MainUI
+        ui = MainUI(dirs, restore=False)
+        self.pump_until(lambda: ui.current_index is not None)
+        results = {}
+        for name in ('cold', 'warm'):
+            samples = []
+            started = time.perf_counter()
+            for button in ui.btn_label_list:
+                if name == 'cold':
+                    self.drop_index(ui)
+                t = time.perf_counter()
+                ui.read_list_img(button)
+                samples.append(time.perf_counter() - t)
+            results[name] = summarize(samples, started)
+            results[name]['rows'] = len(ui.dataset_index)
+        ui.close()
+        return results
+
+    def drop_index(self, ui):
+        # 删除索引缓存, 强制重新扫描
+        for name in os.listdir(ui.disk_cache.index_dir):
+            os.remove(os.path.join(ui.disk_cache.index_dir, name))
+
+    def bench_switch(self, ui, rows):
+        # 选择图像到所有面板显示完成
+        ui.image_cache.clear()
+        samples = []
+        started = time.perf_counter()
+        for k in range(rows):
+            row = (ui.current_index + 1) % len(ui.dataset_index)
+            t = time.perf_counter()
+            ui.select_dataset_row(row)
+            self.pump_until(lambda: ui.current_index == row and not ui.pending_panels)
+            samples.append(time.perf_counter() - t)
+        return summarize(samples, started)
+
+    def bench_diff(self, ui, rows):
+        # 每次清空差异缓存, 测量从提交到所有差异图显示的时间
+        ui.btn_diff.setChecked(True)
+        for draw_label in ui.plot_list:
+            draw_label.diff_mode = True
+        samples = []
+        started = time.perf_counter()
+        for k in range(rows):
+            ui.diff_engine.clear()
+            for i in ui.visible_folders()[1:]:
+                ui.plot_list[i].set_diff_map(None)
+            t = time.perf_counter()
+            ui.calculate_diff_with_gt()
+            self.pump_until(lambda: all(ui.plot_list[i].diff_map is not None
+                                        for i in ui.visible_folders()[1:]))
+            samples.append(time.perf_counter() - t)
+        ui.btn_diff.setChecked(False)
+        for draw_label in ui.plot_list:
+            draw_label.diff_mode = False
+        return summarize(samples, started)
+
+    def bench_magnifier(self, ui, moves):
+        # 模拟鼠标移动, 每次移动同步完成截取与所有可见面板的重绘
+        from PyQt5.QtCore import QEvent, QPoint, Qt
+        from PyQt5.QtGui import QMouseEvent
+        from PyQt5.QtWidgets import QApplication
+        draw_label = ui.plot_list[0]
+        draw_label.update_tracking_flag(True)
+        width, height = max(draw_label.width(), 2), max(draw_label.height(), 2)
+        labels = ui.visible_labels()
+        samples = []
+        started = time.perf_counter()
+        for k in range(moves):
+            # 在面板内来回扫过
+            x = 1 + (k * 7) % (width - 1)
+            y = 1 + (k * 5) % (height - 1)
+            event = QMouseEvent(QEvent.MouseMove, QPoint(x, y), Qt.NoButton, Qt.NoButton, Qt.NoModifier)
+            t = time.perf_counter()
+            QApplication.sendEvent(draw_label, event)
+            ui.render_scheduler.render_frame()
+            for label in labels:
+                label.repaint()
+            samples.append(time.perf_counter() - t)
+        return summarize(samples, started)
+
+
+# ------------------------ Report ------------------------ #
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline, tolerance):
+    # 打印各项 p50 的变化, 超过 tolerance 的变慢视为回归
+    regressions = []
+    for name, result in sorted(flatten(report['results']).items()):
+        old = flatten(baseline.get('results', {})).get(name)
+        if old is None or not old.get('p50_ms'):
+            continue
+        ratio = result['p50_ms'] / old['p50_ms']
+        flag = ''
+        if ratio > 1 + tolerance:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f"{name:24s} p50 {old['p50_ms']:9.2f} -> {result['p50_ms']:9.2f} ms ({ratio:5.2f}x){flag}")
+    return regressions
+
+
+def flatten(results):
+    flat = {}
+    for name, result in results.items():
+        if 'p50_ms' in result:
+            flat[name] = result
+        else:
+            for sub, value in result.items():
+                flat[f"{name}.{sub}"] = value
+    return flat
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Multi-Viewer 性能基准')
+    parser.add_argument('--folders', type=int, default=4, help='对比文件夹数')
+    parser.add_argument('--count', type=int, default=24, help='每个文件夹的图像数')
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--format', choices=('png', 'jpg', 'bmp', 'tif'), default='png')
+    parser.add_argument('--window', type=int, nargs=2, default=(1920, 1080), metavar=('W', 'H'),
+                        help='窗口大小, 决定面板与放大镜的绘制面积')
+    parser.add_argument('--list-count', type=int, default=20000, help='列表读取测试的文件数')
+    parser.add_argument('--switches', type=int, default=20, help='切换图像的次数')
+    parser.add_argument('--diffs', type=int, default=5, help='差异图计算的次数')
+    parser.add_argument('--moves', type=int, default=300, help='放大镜移动的次数')
+    parser.add_argument('--data', default=os.path.join(tempfile.gettempdir(), 'multi-viewer-bench'),
+                        help='合成数据集的目录, 相同参数的数据集会被复用')
+    parser.add_argument('--out', default='bench.json', help='结果文件')
+    parser.add_argument('--compare', help='与之前的结果文件比较')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='p50 变慢超过该比例视为回归')
+    args = parser.parse_args(argv)
+
+    # 索引与缩略图缓存放在临时目录, 不影响也不受用户缓存影响
+    cache_home = tempfile.mkdtemp(prefix='multi-viewer-bench-cache-')
+    os.environ['XDG_CACHE_HOME'] = cache_home
+    os.environ['XDG_CONFIG_HOME'] = cache_home
+
+    from PyQt5.QtCore import PYQT_VERSION_STR, QT_VERSION_STR
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication(sys.argv[:1])
+    bench = Bench(app, tuple(args.window))
+
+    print('generating datasets ...', flush=True)
+    dirs = make_dataset(args.data, args.folders, args.count, args.width, args.height, args.format)
+    list_dirs = make_listing(args.data, args.folders, args.list_count)
+
+    results = {}
+    print('read_list_img ...', flush=True)
+    results['read_list_img'] = bench.bench_read_list(list_dirs)
+
+    started = time.perf_counter()
+    ui = bench.open_viewer(dirs)
+    results['first_pixels'] = summarize([time.perf_counter() - started], started)
+    print('show_selected_img ...', flush=True)
+    results['show_selected_img'] = bench.bench_switch(ui, args.switches)
+    print('calculate_diff_with_gt ...', flush=True)
+    results['calculate_diff_with_gt'] = bench.bench_diff(ui, args.diffs)
+    print('magnifier ...', flush=True)
+    results['magnifier'] = bench.bench_magnifier(ui, args.moves)
+    ui.close()
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'qt': QT_VERSION_STR,
+            'pyqt': PYQT_VERSION_STR,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'params': {key: value for key, value in vars(args).items()
+                       if key not in ('out', 'compare', 'data')},
+        },
+        'results': results,
+    }
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    for name, result in sorted(flatten(results).items()):
+        print(f"{name:24s} p50 {result['p50_ms']:9.2f} ms  p95 {result['p95_ms']:9.2f} ms  "
+              f"{result['throughput_per_s']:8.1f}/s  rss {result['peak_rss_mb']:.0f} MB")
+    print(f"written {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,46 +1,126 @@
 from PyQt5.QtWidgets import *
 from PyQt5.QtGui import *
 from PyQt5.QtCore import *
-import pyqtgraph as pg
 import numpy as np
-import os, sys, cv2
+import json
+import math
+import time
+import os, sys
 
 from src.draw_label import DrawLabel
+from src.image_cache import ImageCache
+from src.memory_manager import MemoryManager, ProcessFootprint
+from src.prefetcher import ImagePrefetcher
+from src.shm_decoder import ShmDecoder
+from src.async_loader import AsyncLoader
+from src.diff_engine import DiffEngine, DIFF_MODES, COLORMAPS, mode_key
+from src.roi_metrics import RoiMetrics
+from src.dataset_index import DatasetIndex, ImageListModel, scan_folder, scan_archive
+from src.disk_cache import DiskCache
+from src.tiled_image import TileCache
+from src.metrics_runner import MetricsRunner, RegionScanRunner
+from src.render_scheduler import RenderScheduler
+from src.batch_mosaic import grid_shape
+from src.playback import PlaybackController, ImageSequence, VideoSequence
+from src.image_io import ARCHIVE_ERRORS, is_video, is_archive, video_frame_count
+from src.window_level import WindowLevel
+from src.tracing import tracer
+from src.trace_overlay import TraceOverlay
 
 
 class MainUI(QMainWindow):
     # ------------------------ Init ------------------------- #
-    def __init__(self):
+    def __init__(self, folders=None, restore=True):
         super().__init__()
 
-        # 绘图背景
-        pg.setConfigOption('background', '#FFFFFF')
-        # pg.setConfigOption('foreground', 'd')
-        pg.setConfigOptions(antialias = True)
-
+        # 启动时打开的文件夹: 命令行参数优先, 其次为上次退出时的会话
+        self.session = self.load_session() if restore and not folders else {}
+        self.initial_folders = list(folders or self.session.get('folders', []))
         self.num_of_folder = None
-        self.raw_col_dict = {'2':(1, 2), '3':(1, 3), '4':(2, 2),
-                             '5':(2, 3), '6':(2, 3)
-                             }
+        # 文件夹多于 page_size 时分页显示, 每页第一个面板固定为真值 (Dir 1)
+        self.page_size = 6
+        self.page = 0
         self.num_of_raw = None
         self.num_of_col = None
         self.compare_window = None
+
+        # 统一的内存预算, 所有图像缓存与面板图像都计入其中
+        self.memory_budget_mb = 2048
+        self.memory_manager = MemoryManager(self.memory_budget_mb * 1024 * 1024)
+        # 解码进程数, 各进程的内存同样计入预算
+        self.decode_workers = max(1, min(4, (os.cpu_count() or 2) - 1))
+        self.process_footprint = ProcessFootprint(self.memory_manager)
+
+        # 图像解码缓存与相邻图像预取
+        self.prefetch_radius = 3
+        self.image_cache = ImageCache(self.memory_manager)
+        # 磁盘上的文件夹索引与缩略图缓存
+        self.disk_cache = DiskCache()
+        # 超大图像按块读取, 所有图像共享一个块缓存
+        self.tile_cache = TileCache(self.memory_manager)
+        # 解码进程写入共享内存, GUI进程零拷贝地包装为 QImage
+        self.shm_decoder = ShmDecoder(self.decode_workers)
+        # 16位/浮点图像共享的窗宽窗位
+        self.window_level = WindowLevel()
+        self.prefetcher = ImagePrefetcher(self.image_cache, radius=self.prefetch_radius,
+                                          disk_cache=self.disk_cache, tile_cache=self.tile_cache,
+                                          decoder=self.shm_decoder, window=self.window_level)
+
+        # 异步切换图像
+        self.diff_engine = DiffEngine(self.memory_manager)
+        self.roi_metrics = RoiMetrics(self.memory_manager)
+        self.async_loader = AsyncLoader(self.prefetcher, self.diff_engine, self.roi_metrics, parent=self)
+        self.async_loader.image_ready.connect(self.on_image_ready)
+        self.async_loader.preview_ready.connect(self.on_preview_ready)
+        self.async_loader.diff_ready.connect(self.on_diff_ready)
+        self.async_loader.full_ready.connect(self.on_full_ready)
+        self.async_loader.roi_ready.connect(self.on_roi_ready)
+        self.load_generation = 0
+        self.pending_panels = set()
+        self.pending_diff = {}
+        self.current_index = None
         
         self.init_ui()
 
         # 状态栏
         self.status = self.statusBar()
         self.status.showMessage('主界面')
+        self.label_fps = QLabel()
+        self.status.addPermanentWidget(self.label_fps)
+        self.render_scheduler.fps_changed.connect(self.show_fps)
+        self.label_playback = QLabel()
+        self.status.addPermanentWidget(self.label_playback)
+        self.label_memory = QLabel()
+        self.status.addPermanentWidget(self.label_memory)
+        self.memory_timer = QTimer(self)
+        self.memory_timer.timeout.connect(self.show_memory_usage)
+        self.memory_timer.start(500)
+
+        # F12 显示各阶段耗时的叠加层, Shift+F12 导出 Chrome trace
+        self.trace_overlay = TraceOverlay(self.right_stack)
+        QShortcut(QKeySequence(Qt.Key_F12), self,
+                  lambda: self.trace_overlay.set_active(not self.trace_overlay.isVisible()))
+        QShortcut(QKeySequence(Qt.SHIFT + Qt.Key_F12), self, self.export_trace)
+        self.switch_started = None
 
         # 标题栏
         self.setWindowTitle('Multi-Viewer')
 
+        # 窗口先显示, 再读取文件夹
+        if self.initial_folders:
+            QTimer.singleShot(0, self.open_initial_folders)
+        else:
+            self.shm_decoder.start()
+
     def init_ui(self):
         # 获取主屏幕大小并设置字体
         self.set_font(0)
         
-        self.get_num_folder()
-        (self.num_of_raw, self.num_of_col) = self.raw_col_dict[str(self.num_of_folder)]
+        if len(self.initial_folders) >= 2:
+            self.num_of_folder = len(self.initial_folders)
+        else:
+            self.get_num_folder()
+        (self.num_of_raw, self.num_of_col) = grid_shape(min(self.num_of_folder, self.page_size))
         
         # 窗口主部件
         self.main_widget = QWidget()
@@ -68,7 +148,10 @@ class MainUI(QMainWindow):
         
         # 将左侧和右侧的部件添加到分隔器中
         splitter.addWidget(self.left_widget)
-        splitter.addWidget(self.right_widget)
+        # 右侧在 QLabel 面板与可缩放的 GraphPanel 之间切换
+        self.right_stack = QStackedWidget()
+        self.right_stack.addWidget(self.right_widget)
+        splitter.addWidget(self.right_stack)
         splitter.setSizes([200, 1700])
 
         self.main_layout.addWidget(splitter, 0, 0, 1, 1)
@@ -102,16 +185,94 @@ class MainUI(QMainWindow):
             self.btn_label_list.append(QPushButton(f"Dir {i+1}"))
             # self.btn_label_list[i].setEnabled(False)
             self.btn_label_list[i].directory = None
-            self.btn_label_list[i].img_list = None
             self.btn_label_list[i].clicked.connect(self.select_dir)
+            # 右键菜单选择视频文件或压缩包
+            self.btn_label_list[i].setContextMenuPolicy(Qt.CustomContextMenu)
+            self.btn_label_list[i].customContextMenuRequested.connect(self.folder_menu)
 
+        # 文件夹较多时按钮排成多列
+        btn_layout = QGridLayout()
+        btn_layout.setContentsMargins(0, 0, 0, 0)
+        btn_container = QWidget()
+        btn_container.setLayout(btn_layout)
+        btn_cols = 1 if self.num_of_folder <= self.page_size else 3
         for i in range(self.num_of_folder):
-            self.left_layout.addWidget(self.btn_label_list[i])
+            btn_layout.addWidget(self.btn_label_list[i], i // btn_cols, i % btn_cols)
+        self.left_layout.addWidget(btn_container)
+
+        # 翻页, 只有当前页的面板会读取和绘制图像
+        page_layout = QHBoxLayout()
+        page_container = QWidget()
+        page_container.setLayout(page_layout)
+        self.btn_prev_page = QPushButton("上一页")
+        self.btn_prev_page.clicked.connect(lambda: self.set_page(self.page - 1))
+        page_layout.addWidget(self.btn_prev_page)
+        self.label_page = QLabel()
+        self.label_page.setAlignment(Qt.AlignCenter)
+        page_layout.addWidget(self.label_page)
+        self.btn_next_page = QPushButton("下一页")
+        self.btn_next_page.clicked.connect(lambda: self.set_page(self.page + 1))
+        page_layout.addWidget(self.btn_next_page)
+        self.left_layout.addWidget(page_container)
+        page_container.setVisible(self.page_count() > 1)
             
-        # 图片列表
-        self.list_img = QListWidget()
-        self.list_img.itemSelectionChanged.connect(self.list_img_function)
+        # 图片列表, 由按文件名配对的索引和虚拟模型提供数据
+        self.dataset_index = DatasetIndex(self.num_of_folder)
+        self.list_model = ImageListModel(self.dataset_index, self.folder_names, self)
+        self.list_img = QListView()
+        self.list_img.setUniformItemSizes(True)
+        self.list_img.setModel(self.list_model)
+        self.list_img.selectionModel().selectionChanged.connect(self.list_img_function)
         self.left_layout.addWidget(self.list_img)
+        self.list_updating = False
+
+        # 监视打开的文件夹, 推理结果仍在写入时增量更新列表; 成批的新文件合并为一次更新
+        self.folder_watcher = QFileSystemWatcher(self)
+        self.folder_watcher.directoryChanged.connect(self.on_directory_changed)
+        self.changed_folders = set()
+        self.watch_timer = QTimer(self)
+        self.watch_timer.setSingleShot(True)
+        self.watch_timer.setInterval(300)
+        self.watch_timer.timeout.connect(self.apply_folder_changes)
+
+        # 全数据集 PSNR/SSIM, 在进程池中计算, 结果可用于排序和筛选列表
+        self.metric_scores = None
+        self.metrics_runner = MetricsRunner(fallback_dir=self.disk_cache.root, parent=self)
+        self.metrics_runner.progress.connect(self.show_metrics_progress)
+        self.metrics_runner.finished.connect(self.on_metrics_finished)
+        self.btn_metrics = QPushButton("计算指标")
+        self.btn_metrics.clicked.connect(self.compute_metrics)
+        self.left_layout.addWidget(self.btn_metrics)
+
+        sort_layout = QHBoxLayout()
+        sort_container = QWidget()
+        sort_container.setLayout(sort_layout)
+        self.combo_sort = QComboBox()
+        self.combo_sort.addItem("文件名", None)
+        for metric in ('psnr', 'ssim'):
+            for i in range(1, self.num_of_folder):
+                self.combo_sort.addItem(f"{metric.upper()} Dir {i+1}", (metric, i))
+        self.combo_sort.currentIndexChanged.connect(self.apply_metric_order)
+        sort_layout.addWidget(self.combo_sort)
+        self.text_threshold = QLineEdit()
+        self.text_threshold.setPlaceholderText("阈值")
+        self.text_threshold.setValidator(QDoubleValidator())
+        self.text_threshold.editingFinished.connect(self.apply_metric_order)
+        sort_layout.addWidget(self.text_threshold)
+        self.left_layout.addWidget(sort_container)
+
+        # 以当前放大框大小扫描全部图像, 列出误差最大的区域, 点击跳转
+        self.region_top_k = 50
+        self.pending_jump = None
+        self.scan_runner = RegionScanRunner(parent=self)
+        self.scan_runner.progress.connect(self.show_scan_progress)
+        self.scan_runner.finished.connect(self.on_scan_finished)
+        self.btn_scan = QPushButton("查找最差区域")
+        self.btn_scan.clicked.connect(self.scan_worst_regions)
+        self.left_layout.addWidget(self.btn_scan)
+        self.list_regions = QListWidget()
+        self.list_regions.itemClicked.connect(self.jump_to_region)
+        self.left_layout.addWidget(self.list_regions)
         
         # 创建分割线1
         h_line = QFrame()
@@ -195,6 +356,81 @@ class MainUI(QMainWindow):
         self.btn_diff.setCheckable(True)
         self.btn_diff.clicked.connect(self.btn_diff_function)
         self.left_layout.addWidget(self.btn_diff)
+        # 差异模式与颜色表, 每种模式对每对图像只计算一次, 切换颜色表只重新查表
+        diff_layout = QHBoxLayout()
+        diff_container = QWidget()
+        diff_container.setLayout(diff_layout)
+        self.combo_diff_mode = QComboBox()
+        for mode, text in DIFF_MODES.items():
+            self.combo_diff_mode.addItem(text, mode)
+        self.combo_diff_mode.currentIndexChanged.connect(self.diff_options_changed)
+        diff_layout.addWidget(self.combo_diff_mode)
+        self.combo_colormap = QComboBox()
+        for colormap, text in COLORMAPS.items():
+            self.combo_colormap.addItem(text, colormap)
+        self.combo_colormap.currentIndexChanged.connect(self.colormap_changed)
+        diff_layout.addWidget(self.combo_colormap)
+        self.spin_diff_threshold = QSpinBox()
+        self.spin_diff_threshold.setRange(0, 255)
+        self.spin_diff_threshold.setValue(16)
+        self.spin_diff_threshold.setToolTip("阈值模式: 灰度差大于该值的像素")
+        self.spin_diff_threshold.valueChanged.connect(self.diff_options_changed)
+        diff_layout.addWidget(self.spin_diff_threshold)
+        self.left_layout.addWidget(diff_container)
+
+        # 放大框内与真值的 PSNR/MSE/MAE, 需要读取原图并预先计算积分图
+        self.btn_roi = QPushButton("区域指标")
+        self.btn_roi.setCheckable(True)
+        self.btn_roi.clicked.connect(self.btn_roi_function)
+        self.left_layout.addWidget(self.btn_roi)
+
+        self.btn_graph = QPushButton("缩放视图")
+        self.btn_graph.setCheckable(True)
+        self.btn_graph.clicked.connect(self.btn_graph_function)
+        self.left_layout.addWidget(self.btn_graph)
+
+        # 16位/浮点图像的窗宽窗位, 拖动时从保留的原始数据重新映射, 不重新解码
+        self.label_window = QLabel()
+        self.label_window.setAlignment(Qt.AlignCenter)
+        self.left_layout.addWidget(self.label_window)
+        self.slider_level = QSlider(Qt.Horizontal)
+        self.slider_level.setRange(0, 1000)
+        self.slider_level.setValue(500)
+        self.left_layout.addWidget(self.slider_level)
+        self.slider_width = QSlider(Qt.Horizontal)
+        self.slider_width.setRange(1, 1000)
+        self.slider_width.setValue(1000)
+        self.left_layout.addWidget(self.slider_width)
+        # 拖动产生的多次变化合并为每帧一次重新映射
+        self.window_timer = QTimer(self)
+        self.window_timer.setSingleShot(True)
+        self.window_timer.setInterval(16)
+        self.window_timer.timeout.connect(self.apply_window_level)
+        self.slider_level.valueChanged.connect(self.window_timer.start)
+        self.slider_width.valueChanged.connect(self.window_timer.start)
+        self.show_window_level()
+
+        # 按帧率同步播放所有文件夹 (图像序列或视频)
+        play_layout = QHBoxLayout()
+        play_container = QWidget()
+        play_container.setLayout(play_layout)
+        self.btn_play = QPushButton("播放")
+        self.btn_play.setCheckable(True)
+        self.btn_play.clicked.connect(self.btn_play_function)
+        play_layout.addWidget(self.btn_play)
+        self.spin_fps = QSpinBox()
+        self.spin_fps.setRange(1, 120)
+        self.spin_fps.setValue(25)
+        self.spin_fps.setSuffix(" FPS")
+        play_layout.addWidget(self.spin_fps)
+        self.left_layout.addWidget(play_container)
+        self.playback = PlaybackController(self.spin_fps.value(), parent=self)
+        self.playback.frame_ready.connect(self.on_playback_frame)
+        self.playback.stats_changed.connect(self.show_playback_stats)
+        self.playback.finished.connect(self.on_playback_finished)
+        self.spin_fps.valueChanged.connect(self.playback.set_fps)
+        self.playback_rows = []
+        self.playback_updating = False
         
         self.btn_reset = QPushButton("重置")
         self.btn_reset.clicked.connect(self.reset)
@@ -213,9 +449,14 @@ class MainUI(QMainWindow):
         self.label = QLabel()
         self.right_layout.addWidget(self.label, 0, 0, self.num_of_raw, self.num_of_col)
 
+        # 所有面板共享一个渲染调度器
+        self.render_scheduler = RenderScheduler(parent=self)
+
         self.plot_list = []
         for i in range(self.num_of_folder):
             img_label = DrawLabel()
+            img_label.render_scheduler = self.render_scheduler
+            img_label.memory_manager = self.memory_manager
             # img_label.setSizePolicy(QSizePolicy.Preferred, QSizePolicy.Preferred)
             # img_label.setFixedSize(img_label.width(), img_label.height())
             img_label.setFrameStyle(QFrame.StyledPanel)
@@ -223,18 +464,71 @@ class MainUI(QMainWindow):
             # img_label.setScaledContents(True)
             self.plot_list.append(img_label)
             # self.plot_list[i].setMinimumSize(400, 400)
-            row = i // self.num_of_col  # 整除得到行号
-            col = i % self.num_of_col   # 取余得到列号
-            self.right_layout.addWidget(self.plot_list[i], row, col, 1, 1)
 
         for i in range(self.num_of_folder):
             # 连接信号
             self.plot_list[i].zoom_rect_moved_signal.connect(self.sync_zoom_rect)
             self.plot_list[i].mouse_tracking_signal.connect(self.sync_mouse_tracking)
             self.plot_list[i].comparison_ready_signal.connect(self.comparison_ready)
+            self.plot_list[i].full_resolution_signal.connect(self.load_full_resolution)
+
+        # 可缩放视图在第一次使用时创建, 启动时不导入 pyqtgraph
+        self.graph_panel = None
+        self.layout_panels()
+
+    def page_count(self):
+        if self.num_of_folder <= self.page_size:
+            return 1
+        return math.ceil((self.num_of_folder - 1) / (self.page_size - 1))
+
+    def visible_folders(self):
+        if self.num_of_folder <= self.page_size:
+            return list(range(self.num_of_folder))
+        start = 1 + self.page * (self.page_size - 1)
+        return [0] + list(range(start, min(start + self.page_size - 1, self.num_of_folder)))
+
+    def visible_labels(self):
+        return [self.plot_list[i] for i in self.visible_folders()]
+
+    def layout_panels(self):
+        # 当前页的面板放入网格, 其余面板隐藏并释放图像
+        visible = self.visible_folders()
+        reference = self.plot_list[0]
+        for i, draw_label in enumerate(self.plot_list):
+            self.right_layout.removeWidget(draw_label)
+            if i not in visible:
+                draw_label.hide()
+                draw_label.clear_image()
+                if self.graph_panel is not None:
+                    self.graph_panel.set_image(i, None)
+        for slot, i in enumerate(visible):
+            draw_label = self.plot_list[i]
+            # 新显示的面板沿用放大框位置与跟踪状态
+            if draw_label is not reference:
+                draw_label.mouse_x, draw_label.mouse_y = reference.mouse_x, reference.mouse_y
+                draw_label.update_tracking_flag(reference.mouse_tracking_flag)
+            self.right_layout.addWidget(draw_label, slot // self.num_of_col, slot % self.num_of_col, 1, 1)
+            draw_label.show()
+        if self.graph_panel is not None:
+            self.graph_panel.set_folders(visible, self.num_of_col)
+        self.label_page.setText(f"{self.page + 1} / {self.page_count()}")
+
+    def set_page(self, page):
+        page = max(0, min(page, self.page_count() - 1))
+        if page == self.page:
+            return
+        self.page = page
+        self.layout_panels()
+        self.list_img_function()
 
     # ----------------------- Widget Function ---------------------- #
     def list_img_function(self):
+        if self.playback_updating or self.list_updating:
+            return
+        if self.playback.is_running():
+            # 播放中选择其他图像, 从该图像继续播放
+            self.start_playback()
+            return
         if self.btn_diff.isChecked():
             self.show_selected_img()
             self.calculate_diff_with_gt()
@@ -242,6 +536,8 @@ class MainUI(QMainWindow):
             self.show_selected_img()
         
     def btn_diff_function(self):
+        for draw_label in self.plot_list:
+            draw_label.diff_mode = self.btn_diff.isChecked()
         if self.btn_diff.isChecked():
             self.show_selected_img()
             self.calculate_diff_with_gt()
@@ -274,8 +570,10 @@ class MainUI(QMainWindow):
         grid_widget = QWidget()
         grid_layout = QGridLayout(grid_widget)
         
-        # 遍历所有 DrawLabel 实例并获取 zoomed_area_pixmap
-        for i, draw_label in enumerate(self.plot_list):
+        # 遍历当前页的 DrawLabel 实例并获取 zoomed_area_pixmap
+        slot = 0
+        for i in self.visible_folders():
+            draw_label = self.plot_list[i]
             if draw_label.zoomed_area_pixmap:
                 # 创建垂直布局
                 vertical_layout = QVBoxLayout()
@@ -294,12 +592,14 @@ class MainUI(QMainWindow):
                 vertical_layout.addWidget(img_label)
                 vertical_layout.addWidget(text_label)
                 
-                row = i // self.num_of_col  # 设置N行M列
-                col = i % self.num_of_col
+                row = slot // self.num_of_col  # 设置N行M列
+                col = slot % self.num_of_col
+                slot += 1
                 
                 grid_layout.addWidget(vertical_container, row, col)
 
         main_layout.addWidget(grid_widget)
+        self.compare_grid = grid_widget
 
         # 保存按钮
         save_button = QPushButton("保存对比图")
@@ -324,35 +624,252 @@ class MainUI(QMainWindow):
         self.set_font(screen_num)
         
         if ok:
-            if num_str.isdigit() and int(num_str) <= 6 and int(num_str) >= 2:
+            if num_str.isdigit() and int(num_str) >= 2:
                 self.num_of_folder = int(num_str)
-            elif int(num_str) > 6 or int(num_str) < 2:
-                print("对比文件夹数需在2-6个，请重新输入。")
+            elif num_str.isdigit():
+                print("对比文件夹数至少为2个，请重新输入。")
                 self.get_num_folder()
             else:
                 print("输入的不是数字，请重新输入。")
                 self.get_num_folder()
                 
     def read_list_img(self, btn):
-        files = set(os.listdir(btn.directory))
-        
-        image_files = [filename for filename in files if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.gif'))]
-        sorted_image_files = sorted(image_files)
-        btn.img_list = sorted_image_files
+        folder = self.btn_label_list.index(btn)
+        selected_row = self.selected_row()
+        selected_key = self.dataset_index.key(selected_row) if selected_row is not None else None
+
+        if is_video(btn.directory):
+            self.dataset_index.set_video(folder, btn.directory, video_frame_count(btn.directory))
+        elif is_archive(btn.directory):
+            # 成员表同样缓存在磁盘索引中, 压缩包未修改时不再遍历
+            with tracer.span('read.list', directory=btn.directory):
+                entries = self.disk_cache.load_index(btn.directory)
+                if entries is None:
+                    try:
+                        entries = scan_archive(btn.directory)
+                    except ARCHIVE_ERRORS:
+                        # 索引保持不变, 由调用方恢复按钮
+                        self.status.showMessage(f"无法读取压缩包: {btn.directory}")
+                        return False
+                    self.disk_cache.save_index(btn.directory, entries)
+            self.dataset_index.set_archive(folder, btn.directory, entries)
+        else:
+            with tracer.span('read.list', directory=btn.directory):
+                entries = self.disk_cache.load_index(btn.directory)
+                if entries is None:
+                    entries = scan_folder(btn.directory)
+                    self.disk_cache.save_index(btn.directory, entries)
+            self.dataset_index.set_folder(folder, btn.directory, entries)
+        self.discard_row_results()
+        self.list_model.refresh()
+        self.show_missing_summary()
+        self.watch_folders()
 
-        if btn is not self.btn_label_list[0]:
-                return
-        # 将排序后的文件添加到列表中
-        self.list_img.clear()
-        for filename in sorted_image_files:
+        # 索引重建后恢复之前选中的图像
+        if selected_key is not None:
+            self.select_dataset_row(self.dataset_index.row_of(selected_key))
+        return True
 
-            self.list_img.addItem(filename)
+    def discard_row_results(self):
+        # 行号已变化, 之前的指标与扫描结果作废
+        # 取消的运行不会发出 finished, 按钮在这里恢复, 新的运行不必等待旧线程退出
+        self.metrics_runner.cancel()
+        self.metric_scores = None
+        self.btn_metrics.setEnabled(True)
+        self.scan_runner.cancel()
+        self.list_regions.clear()
+        self.pending_jump = None
+        self.btn_scan.setEnabled(True)
+
+    def watch_folders(self):
+        # 只监视图像文件夹, 视频与压缩包不会在打开后追加内容
+        directories = {button.directory for button in self.btn_label_list
+                       if button.directory and os.path.isdir(button.directory)}
+        watched = set(self.folder_watcher.directories())
+        if watched - directories:
+            self.folder_watcher.removePaths(list(watched - directories))
+        if directories - watched:
+            self.folder_watcher.addPaths(list(directories - watched))
+
+    def on_directory_changed(self, directory):
+        # 不重新计时: 持续写入时也按固定间隔更新
+        self.changed_folders.add(directory)
+        if not self.watch_timer.isActive():
+            self.watch_timer.start()
+
+    def apply_folder_changes(self):
+        if self.playback.is_running():
+            # 播放按行号推进, 结束后再更新
+            self.watch_timer.start()
+            return
+        changed, self.changed_folders = self.changed_folders, set()
+        selected_row = self.selected_row()
+        selected_key = self.dataset_index.key(selected_row) if selected_row is not None else None
+        current = self.current_index
+        current_key = self.dataset_index.key(current) if current is not None else None
+        current_missing = self.dataset_index.missing_folders(current) if current is not None else None
+
+        updated = False
+        self.list_updating = True
+        for folder, button in enumerate(self.btn_label_list):
+            if button.directory not in changed or self.dataset_index.entries[folder] is None:
+                continue
+            try:
+                entries = scan_folder(button.directory)
+            except OSError:
+                # 文件夹已被删除或改名
+                continue
+            if entries == self.dataset_index.entries[folder]:
+                continue
+            self.disk_cache.save_index(button.directory, entries)
+            self.list_model.update_folder(folder, entries)
+            updated = True
+        self.list_updating = False
+        if not updated:
+            return
+        self.discard_row_results()
+        self.show_missing_summary()
+
+        # 当前图像只是换了行号时不重新加载, 面板与放大框保持不变
+        if current_key is not None:
+            self.current_index = self.dataset_index.row_of(current_key)
+        row = self.selected_row()
+        if selected_key is not None and (row is None or self.dataset_index.key(row) != selected_key):
+            # 选中的图像被删除或列表被重置, 视图可能已自行移动了选择, 因此显式重新加载
+            self.list_updating = True
+            self.select_dataset_row(self.dataset_index.nearest_row(selected_key))
+            self.list_updating = False
+            self.list_img_function()
+        elif self.current_index is not None and self.dataset_index.missing_folders(self.current_index) != current_missing:
+            # 当前图像在某个文件夹中新出现或被删除
+            self.list_img_function()
+
+    def folder_names(self):
+        return [f"Dir {i+1}" for i in range(self.num_of_folder)]
+
+    def selected_row(self):
+        # 返回索引中的行号, 列表可能按指标重新排序过
+        indexes = self.list_img.selectionModel().selectedIndexes()
+        if not indexes:
+            return None
+        return self.list_model.dataset_row(indexes[-1].row())
+
+    def select_dataset_row(self, row):
+        if row is None:
+            return
+        model_row = self.list_model.model_row(row)
+        if model_row is not None:
+            self.list_img.setCurrentIndex(self.list_model.index(model_row))
+
+    def compute_metrics(self):
+        if self.dataset_index.has_folder(0) and self.metrics_runner.start(self.dataset_index):
+            self.btn_metrics.setEnabled(False)
+
+    def show_metrics_progress(self, done, total):
+        self.status.showMessage(f"计算指标: {done}/{total}")
+
+    def on_metrics_finished(self, scores):
+        self.btn_metrics.setEnabled(True)
+        if len(scores['psnr']) != len(self.dataset_index):
+            return
+        self.metric_scores = scores
+        self.status.showMessage("指标计算完成")
+        self.apply_metric_order()
+
+    def scan_worst_regions(self):
+        if not self.dataset_index.has_folder(0):
+            return
+        draw_label = self.plot_list[0]
+        rect_size = (draw_label.select_rect_width, draw_label.select_rect_height)
+        label_size = (draw_label.width(), draw_label.height())
+        if self.scan_runner.start(self.dataset_index, rect_size, label_size, self.region_top_k):
+            self.btn_scan.setEnabled(False)
+            self.list_regions.clear()
+
+    def show_scan_progress(self, done, total):
+        self.status.showMessage(f"扫描区域: {done}/{total}")
+
+    def on_scan_finished(self, regions):
+        self.btn_scan.setEnabled(True)
+        self.status.showMessage(f"找到 {len(regions)} 个区域")
+        names = self.folder_names()
+        for mse, row, folder, cx, cy in regions:
+            if row >= len(self.dataset_index):
+                continue
+            item = QListWidgetItem(f"{self.dataset_index.key(row)}  {names[folder]}  ({cx}, {cy})  MSE {mse:.1f}")
+            item.setData(Qt.UserRole, (row, folder, cx, cy))
+            self.list_regions.addItem(item)
+
+    def jump_to_region(self, item):
+        row, folder, cx, cy = item.data(Qt.UserRole)
+        self.pending_jump = (row, folder, cx, cy)
+        if folder not in self.visible_folders():
+            # 翻到该方法所在的页
+            self.set_page((folder - 1) // (self.page_size - 1))
+        if self.list_model.model_row(row) is None:
+            # 被阈值筛掉的图像, 恢复完整列表
+            self.combo_sort.setCurrentIndex(0)
+        if self.current_index == row and not self.pending_panels:
+            self.apply_pending_jump()
+        else:
+            self.select_dataset_row(row)
+
+    def apply_pending_jump(self):
+        # 图像显示后才知道缩放比例, 把原图坐标换算为面板坐标并同步放大框
+        if self.pending_jump is None or self.pending_jump[0] != self.current_index:
+            return
+        row, folder, cx, cy = self.pending_jump
+        self.pending_jump = None
+        draw_label = self.plot_list[folder]
+        if draw_label.pixmap() is None or draw_label.pixmap().isNull():
+            return
+        x_offset, y_offset = draw_label.get_image_offset()
+        self.sync_mouse_tracking(False)
+        self.comparison_ready(True)
+        self.sync_zoom_rect(int(cx / draw_label.scale_ratio) + x_offset,
+                            int(cy / draw_label.scale_ratio) + y_offset)
+
+    def apply_metric_order(self):
+        # 按所选指标升序排列 (最差的在前), 填写阈值时只保留不高于阈值的图像
+        selected_row = self.selected_row()
+        sort_key = self.combo_sort.currentData()
+        if sort_key is None or self.metric_scores is None:
+            self.list_model.set_order()
+        else:
+            metric, folder = sort_key
+            values = self.metric_scores[metric][:, folder]
+            order = np.argsort(values, kind='stable')  # nan 排在最后
+            threshold = self.text_threshold.text()
+            if threshold:
+                try:
+                    order = order[values[order] <= float(threshold)]
+                except ValueError:
+                    pass
+            self.list_model.set_order(order, values[order])
+        self.select_dataset_row(selected_row)
+
+    def show_missing_summary(self):
+        # 各文件夹缺少的图像数量, 缺失的条目在列表中标红
+        total = len(self.dataset_index)
+        missing = [f"{name} 缺少 {total - len(entries)} 张"
+                   for name, entries in zip(self.folder_names(), self.dataset_index.entries)
+                   if entries is not None and len(entries) < total]
+        self.status.showMessage('; '.join(missing) if missing else f"共 {total} 张")
     
     def sync_zoom_rect(self, x, y):
-        # 更新所有DrawLabel的视图
-        for draw_label in self.plot_list:
+        # 只更新当前页的DrawLabel, 其余面板翻页时再同步
+        for draw_label in self.visible_labels():
             draw_label.update_zoom_rect(x, y)
     
+    def show_memory_usage(self):
+        processes = self.process_footprint.update() / 1024 / 1024
+        used = self.memory_manager.used_bytes / 1024 / 1024
+        budget = self.memory_manager.budget_bytes / 1024 / 1024
+        self.label_memory.setText(f"内存 {used:.0f} / {budget:.0f} MB (子进程 {processes:.0f} MB)")
+
+    def show_fps(self, fps):
+        self.label_fps.setText(f"放大镜 {fps:.0f} FPS")
+
     def sync_mouse_tracking(self, flag):
         # 更新所有mouse tracking flag
         for draw_label in self.plot_list:
@@ -364,10 +881,38 @@ class MainUI(QMainWindow):
         directory = QFileDialog.getExistingDirectory(self, "选择文件夹")
 
         if directory:
-            button.directory = directory
-            button.setText('.../'+directory.split('/')[-2]+'/'+directory.split('/')[-1])
-        
-        self.read_list_img(button)
+            self.open_folder(button, directory)
+
+    def folder_menu(self, pos):
+        button = self.sender()
+        menu = QMenu(self)
+        action_video = menu.addAction("选择视频文件")
+        action_archive = menu.addAction("选择压缩包")
+        action = menu.exec_(button.mapToGlobal(pos))
+        path = None
+        if action is action_video:
+            path, _ = QFileDialog.getOpenFileName(self, "选择视频文件", "",
+                                                  "Videos (*.mp4 *.avi *.mov *.mkv);;All Files (*)")
+        elif action is action_archive:
+            path, _ = QFileDialog.getOpenFileName(self, "选择压缩包", "",
+                                                  "Archives (*.zip *.tar *.tar.gz *.tgz *.tar.bz2 *.tar.xz);;All Files (*)")
+        if path:
+            self.open_folder(button, path)
+
+    def open_folder(self, button, path):
+        # 文件夹, 视频文件或压缩包; 其他文件 (例如 "All Files" 中选择的 .webm) 与无法读取的压缩包不能打开, 按钮保持原状态
+        if not (os.path.isdir(path) or is_video(path) or is_archive(path)):
+            self.status.showMessage(f"不支持的文件: {path}")
+            return
+        previous = button.directory, button.text()
+        button.directory = path
+        if os.path.isdir(path):
+            button.setText('.../' + '/'.join(path.rstrip('/').split('/')[-2:]))
+        else:
+            button.setText('.../' + os.path.basename(path))
+        if not self.read_list_img(button):
+            button.directory, text = previous
+            button.setText(text)
 
     def set_font(self, screen_num):
         # ratio = 140
@@ -391,6 +936,8 @@ class MainUI(QMainWindow):
         for draw_label in self.plot_list:
             draw_label.set_zoom_interpolation(self.radio_interpolation.isChecked())
             draw_label.update_status()
+        if self.graph_panel is not None:
+            self.graph_panel.set_smooth(self.radio_interpolation.isChecked())
         
     # 令窗口位于中心位置
     def set_window_center(self, window):
@@ -412,95 +959,445 @@ class MainUI(QMainWindow):
                                                   "Save File", "", 
                                                   "Images (*.png *.xpm *.jpg);;All Files (*)", 
                                                   options=options)
-        # TODO 保存对比图的逻辑
         if filename:
-            pass
+            self.compare_grid.grab().save(filename)
         
     def show_selected_img(self):
-        selected_img = self.list_img.selectedItems()
-        for item in selected_img:
-            index = self.list_img.row(item)
+        index = self.selected_row()
             
-        if selected_img:
-            # filename = selected_img[0].text()
-            for i, btn in enumerate(self.btn_label_list):
-                if btn.img_list:
-                    filename = btn.img_list[index]
-                    # 清空QLabel
-                    self.plot_list[i].setPixmap(QPixmap())
-                    if btn.directory:
-                        img_path = os.path.join(btn.directory, filename)
-                        pixmap = QPixmap(img_path)
-                        self.plot_list[i].file_name = filename
-                        self.plot_list[i].origin_image = pixmap
-                        self.plot_list[i].setFixedSize(self.plot_list[i].width(), self.plot_list[i].height())
-                        self.plot_list[i].setPixmap(pixmap.scaled(self.plot_list[i].width(), self.plot_list[i].height(), 
-                                                                Qt.KeepAspectRatio, Qt.SmoothTransformation))
-                        self.plot_list[i].scale_ratio = self.plot_list[i].origin_image.height() / self.plot_list[i].pixmap().height()
-                        self.plot_list[i].update_status()
+        if index is not None:
+            # 在工作线程中读取并缩放, 旧的选择会被新的 generation 取代
+            items = []
+            for i in self.visible_folders():
+                filename = self.dataset_index.filename(index, i)
+                draw_label = self.plot_list[i]
+                if filename is None:
+                    # 该文件夹缺少这张图像, 清空面板而不是显示错位的图像
+                    if self.dataset_index.has_folder(i):
+                        draw_label.clear_image()
+                        if self.graph_panel is not None:
+                            self.graph_panel.set_image(i, None)
+                    continue
+                draw_label.setFixedSize(draw_label.width(), draw_label.height())
+                draw_label.set_loading(True)
+                items.append((i, self.dataset_index.path(index, i), filename,
+                              draw_label.width(), draw_label.height()))
+            self.load_generation = self.async_loader.submit_load(items)
+            self.switch_started = time.perf_counter()
+            self.pending_panels = {item[0] for item in items}
+            self.pending_diff = {}
+            self.current_index = index
+
+    def on_image_ready(self, generation, i, filename, origin, display):
+        # 只有最新一次选择的结果才会显示
+        if self.async_loader.is_stale(generation):
+            return
+        draw_label = self.plot_list[i]
+        draw_label.file_name = filename
+        draw_label.set_origin_image(origin)
+        draw_label.set_error_tables(None)
+        draw_label.set_diff_map(None)
+        draw_label.image_path = self.dataset_index.path(self.current_index, i)
+        draw_label.generation = generation
+        if i in self.pending_diff:
+            diff_map, display = self.pending_diff.pop(i)
+            draw_label.set_diff_map(diff_map)
+        with tracer.span('pixmap', panel=i):
+            draw_label.setPixmap(QPixmap.fromImage(display))
+        draw_label.scale_ratio = origin.height() / draw_label.pixmap().height()
+        draw_label.set_loading(False)
+        draw_label.update_status()
+        if self.btn_graph.isChecked():
+            self.graph_panel.set_image(i, origin)
+
+        self.pending_panels.discard(i)
+        if not self.pending_panels:
+            # 从选择图像到所有面板显示完成
+            if self.switch_started is not None:
+                tracer.record('switch', self.switch_started, time.perf_counter(), {'row': self.current_index})
+                self.switch_started = None
+            if self.btn_roi.isChecked():
+                self.calculate_roi_tables()
+            self.apply_pending_jump()
+            self.prefetch_neighbours(self.current_index)
+
+    def on_preview_ready(self, generation, i, filename, preview, display):
+        # 缩略图先行显示, 原图到达后由 on_image_ready 替换
+        draw_label = self.plot_list[i]
+        if self.async_loader.is_stale(generation) or draw_label.generation == generation:
+            return
+        draw_label.file_name = filename
+        draw_label.set_origin_image(preview)
+        draw_label.setPixmap(QPixmap.fromImage(display))
+        draw_label.scale_ratio = preview.height() / draw_label.pixmap().height()
+        draw_label.set_loading(False)
+        draw_label.update_status()
+
+    def prefetch_neighbours(self, index):
+        # 预解码所有文件夹中当前图像前后 prefetch_radius 张
+        paths = []
+        # 相邻关系以列表当前的显示顺序为准
+        model_row = self.list_model.model_row(index)
+        if model_row is None:
+            return
+        for row in self.prefetcher.neighbour_rows(model_row, self.list_model.rowCount()):
+            row = self.list_model.dataset_row(row)
+            for i in self.visible_folders():
+                path = self.dataset_index.path(row, i)
+                if path is not None:
+                    paths.append(path)
+        draw_label = self.plot_list[0]
+        self.prefetcher.prefetch(paths, draw_label.width(), draw_label.height())
+
+    def load_full_resolution(self):
+        # 放大镜需要原图像素时才读取原图
+        self.load_full_resolution_at(self.plot_list.index(self.sender()))
+
+    def load_full_resolution_at(self, i):
+        draw_label = self.plot_list[i]
+        if draw_label.image_path and draw_label.origin_image is not None:
+            self.async_loader.submit_full(i, draw_label.image_path, draw_label.origin_image)
+
+    def on_full_ready(self, i, image):
+        draw_label = self.plot_list[i]
+        if draw_label.origin_image is image:
+            draw_label.update_status()
+            if self.graph_panel is not None:
+                self.graph_panel.refresh(i)
+
+    def ensure_graph_panel(self):
+        # 可缩放视图, 与 QLabel 面板显示同一组图像
+        if self.graph_panel is None:
+            from src.graph_panel import GraphPanel
+            self.graph_panel = GraphPanel(self.num_of_folder, self.num_of_col)
+            self.graph_panel.full_resolution_signal.connect(self.load_full_resolution_at)
+            self.graph_panel.set_folders(self.visible_folders(), self.num_of_col)
+            self.graph_panel.set_smooth(self.radio_interpolation.isChecked())
+            self.right_stack.addWidget(self.graph_panel)
+        return self.graph_panel
+
+    def btn_graph_function(self):
+        if self.btn_graph.isChecked():
+            self.ensure_graph_panel()
+            for i, draw_label in enumerate(self.plot_list):
+                self.graph_panel.set_image(i, draw_label.origin_image)
+            self.right_stack.setCurrentWidget(self.graph_panel)
+        else:
+            self.right_stack.setCurrentWidget(self.right_widget)
     
+    def show_window_level(self):
+        self.label_window.setText(f"窗位 {self.window_level.level():.3f}  窗宽 {self.window_level.width():.3f}")
+
+    def apply_window_level(self):
+        # 滑块值为标称范围的千分之一
+        level = self.slider_level.value() / 1000
+        width = self.slider_width.value() / 1000
+        self.window_level.set_window(level - width / 2, level + width / 2)
+        self.show_window_level()
+        changed = False
+        for i in self.visible_folders():
+            draw_label = self.plot_list[i]
+            image = draw_label.origin_image
+            if image is None or not image.apply_window():
+                continue
+            changed = True
+            if not self.btn_diff.isChecked() or i == 0:
+                draw_label.setPixmap(QPixmap.fromImage(image.scaled(draw_label.width(), draw_label.height())))
+            draw_label.update_status()
+            if self.btn_graph.isChecked():
+                self.graph_panel.refresh(i)
+        if changed:
+            # 差异图与区域指标基于映射后的像素, 需要重新计算
+            self.diff_engine.clear()
+            self.roi_metrics.clear()
+            if self.btn_diff.isChecked():
+                self.calculate_diff_with_gt()
+            if self.btn_roi.isChecked():
+                self.calculate_roi_tables()
+
+    def btn_play_function(self):
+        if self.btn_play.isChecked():
+            self.start_playback()
+        else:
+            self.playback.stop()
+            self.label_playback.setText('')
+            self.list_img_function()
+
+    def start_playback(self):
+        # 从当前选中的图像开始, 按列表的显示顺序播放
+        self.playback_rows = [self.list_model.dataset_row(r) for r in range(self.list_model.rowCount())]
+        indexes = self.list_img.selectionModel().selectedIndexes()
+        start = indexes[-1].row() if indexes else 0
+        frame_count = len(self.playback_rows)
+        sequences = {}
+        for i in self.visible_folders():
+            if not self.dataset_index.has_folder(i):
+                continue
+            if self.dataset_index.is_video(i) and self.list_model.order is None:
+                # 未排序时视频顺序解码, 比逐帧定位快得多
+                sequences[i] = VideoSequence(self.dataset_index.directories[i])
+                frame_count = min(frame_count, self.dataset_index.videos[i])
+            else:
+                sequences[i] = ImageSequence([self.dataset_index.path(row, i) for row in self.playback_rows])
+        if not sequences or start >= frame_count:
+            self.btn_play.setChecked(False)
+            return
+        # 丢弃尚未完成的单张加载
+        self.async_loader.submit_load([])
+        self.pending_panels = set()
+        draw_label = self.plot_list[0]
+        self.playback.start(sequences, frame_count, start, draw_label.width(), draw_label.height())
+
+    def on_playback_frame(self, frame, results):
+        row = self.playback_rows[frame]
+        self.current_index = row
+        for i, (image, display) in results.items():
+            draw_label = self.plot_list[i]
+            if image is None:
+                draw_label.clear_image()
+                continue
+            draw_label.file_name = self.dataset_index.filename(row, i)
+            draw_label.set_origin_image(image)
+            draw_label.set_error_tables(None)
+            # 播放时不计算差异图, 放大镜改从当前帧截取
+            draw_label.set_diff_map(None)
+            draw_label.image_path = self.dataset_index.path(row, i)
+            draw_label.setPixmap(QPixmap.fromImage(display))
+            draw_label.scale_ratio = image.height() / draw_label.pixmap().height()
+            draw_label.set_loading(False)
+            # 放大镜在播放时照常工作
+            draw_label.update_status()
+            if self.btn_graph.isChecked():
+                self.graph_panel.set_image(i, image)
+        # 列表跟随当前帧, 不触发重新加载
+        self.playback_updating = True
+        self.list_img.setCurrentIndex(self.list_model.index(frame))
+        self.playback_updating = False
+
+    def show_playback_stats(self, stats):
+        self.label_playback.setText(f"播放 {stats['fps']} FPS  丢帧 {stats['dropped']}  "
+                                    f"延迟 {stats['latency_ms']:.0f} ms  缓冲 {stats['buffered']}")
+
+    def on_playback_finished(self):
+        self.btn_play.setChecked(False)
+        self.btn_play_function()
+
     def calculate_diff_with_gt(self):
-        gt_img = cv2.imread(os.path.join(self.btn_label_list[0].directory, self.plot_list[0].file_name))
-        diff_maps = []
-        for i, draw_label in enumerate(self.plot_list):
-            if self.btn_label_list[i].img_list:
-                if i==0:
-                    draw_label.update_status()
-                    continue
-                img = cv2.imread(os.path.join(self.btn_label_list[i].directory, draw_label.file_name))
-                draw_label.diff_map = cv2.cvtColor(cv2.absdiff(gt_img, img), cv2.COLOR_BGR2GRAY)
-                diff_maps.append(draw_label.diff_map)
+        index = self.current_index
+        if index is None:
+            return
+        gt_path = self.dataset_index.path(index, 0)
+        if gt_path is None:
+            return
+        items = []
+        for i in self.visible_folders()[1:]:
+            path = self.dataset_index.path(index, i)
+            if path is None:
+                continue
+            draw_label = self.plot_list[i]
+            items.append((i, path, draw_label.width(), draw_label.height()))
+        if items:
+            self.async_loader.submit_diff(gt_path, items, *self.diff_options())
 
-        all_diff = np.array(diff_maps)
-        min_val = np.min(all_diff)
-        max_val = np.max(all_diff)
-        
-        normalized_diff = self.normalize_diff_map(diff_maps, min_val, max_val)
-        
-        for i, draw_label in enumerate(self.plot_list):
-            if self.btn_label_list[i].img_list:
-                if i==0:
-                    continue
-                height, width = draw_label.diff_map.shape
-                bytesPerLine = width
-
-                # 创建QImage对象
-                qImg = QImage(normalized_diff[i-1].data, width, height, bytesPerLine, QImage.Format_Grayscale8)
-                pixmap = QPixmap.fromImage(qImg)
-                draw_label.setPixmap(pixmap.scaled(self.plot_list[i].width(), self.plot_list[i].height(), 
-                                                                Qt.KeepAspectRatio, Qt.SmoothTransformation))
+    def diff_options(self):
+        # (模式, 颜色表, 阈值)
+        return (self.combo_diff_mode.currentData(), self.combo_colormap.currentData(),
+                self.spin_diff_threshold.value())
+
+    def diff_options_changed(self):
+        # 已计算过的模式直接命中缓存
+        if self.btn_diff.isChecked():
+            self.calculate_diff_with_gt()
+
+    def colormap_changed(self):
+        if not self.btn_diff.isChecked():
+            return
+        colormap = self.combo_colormap.currentData()
+        for i in self.visible_folders()[1:]:
+            draw_label = self.plot_list[i]
+            if draw_label.diff_map is not None and draw_label.diff_map.set_colormap(colormap):
+                draw_label.setPixmap(QPixmap.fromImage(draw_label.diff_map.scaled(draw_label.width(),
+                                                                                   draw_label.height())))
                 draw_label.update_status()
-    
-    def normalize_diff_map(self, diff_maps, min_val, max_val):
-        normalized_images = []
-        for img in diff_maps:
-            mask = ((img >= min_val) & (img <= max_val)).astype('uint8') * 255
-            # 归一化图像
-            norm_img = cv2.normalize(img, None, alpha=0, beta=255, 
-                                    norm_type=cv2.NORM_MINMAX, 
-                                    dtype=cv2.CV_32F,
-                                    mask=mask)
-            normalized_images.append(norm_img.astype(np.uint8))
-        return normalized_images
+
+    def btn_roi_function(self):
+        if self.btn_roi.isChecked():
+            self.calculate_roi_tables()
+        else:
+            for draw_label in self.plot_list:
+                draw_label.set_error_tables(None)
+                draw_label.update_status()
+
+    def calculate_roi_tables(self):
+        index = self.current_index
+        if index is None or self.pending_panels:
+            return
+        gt_path = self.dataset_index.path(index, 0)
+        if gt_path is None:
+            return
+        items = [(i, self.dataset_index.path(index, i)) for i in self.visible_folders()[1:]
+                 if self.dataset_index.path(index, i) is not None]
+        if items:
+            self.async_loader.submit_roi(gt_path, items)
+
+    def on_roi_ready(self, generation, results):
+        if self.async_loader.is_stale(generation) or not self.btn_roi.isChecked():
+            return
+        for i, tables in results.items():
+            draw_label = self.plot_list[i]
+            if draw_label.generation == generation:
+                draw_label.set_error_tables(tables)
+                draw_label.update_status()
+
+    def on_diff_ready(self, generation, results):
+        if self.async_loader.is_stale(generation) or not self.btn_diff.isChecked():
+            return
+        mode, colormap, threshold = self.diff_options()
+        for i, (diff_map, display) in results.items():
+            # 切换模式前提交的结果不再显示
+            if diff_map.mode != mode_key(mode, threshold):
+                continue
+            draw_label = self.plot_list[i]
+            if draw_label.generation != generation:
+                # 该面板的原图尚未到达, 等 on_image_ready 时再显示差异图
+                self.pending_diff[i] = (diff_map, display)
+                continue
+            draw_label.set_diff_map(diff_map)
+            draw_label.setPixmap(QPixmap.fromImage(display))
+            draw_label.update_status()
     
     def quit_act(self):
         # sender 发送信号的对象
         sender = self.sender()
+        self.close()
         qApp = QApplication.instance()
         qApp.quit()
     
     def reset(self):
+        # 新建一个窗口重新选择文件夹, 当前窗口的后台任务全部停止后关闭
+        window = MainUI(restore=False)
+        QApplication.instance().main_window = window
         self.close()
-        self.__init__()
-    
+
+    def shutdown(self):
+        self.playback.stop()
+        self.metrics_runner.cancel()
+        self.scan_runner.cancel()
+        self.async_loader.shutdown()
+        self.prefetcher.shutdown()
+        self.shm_decoder.shutdown()
+
+    def export_trace(self):
+        path, _ = QFileDialog.getSaveFileName(self, "导出 Chrome trace", "trace.json", "JSON (*.json)")
+        if path:
+            count = tracer.export_chrome_trace(path)
+            self.status.showMessage(f"已导出 {count} 个事件: {path}")
+
+    # ----------------------- Session ---------------------- #
+    def open_initial_folders(self):
+        # 命令行或会话中的文件夹, 视频文件与压缩包按文件打开
+        for button, directory in zip(self.btn_label_list, self.initial_folders):
+            if os.path.exists(directory):
+                self.open_folder(button, directory)
+        self.restore_session_view()
+        # 第一批图像在线程中解码, 同时启动解码进程
+        self.shm_decoder.start()
+
+    def restore_session_view(self):
+        session = self.session
+        if 'box' in session:
+            width, height = session['box']
+            self.input_width.setText(str(width))
+            self.input_height.setText(str(height))
+            self.change_box()
+        if 'ratio' in session:
+            self.slider_enlarge.setValue(session['ratio'])
+        if 'page' in session:
+            self.set_page(session['page'])
+        row = self.dataset_index.row_of(session['selected']) if 'selected' in session else None
+        if row is None and len(self.dataset_index):
+            row = 0
+        self.select_dataset_row(row)
+
+    @staticmethod
+    def settings():
+        return QSettings('Multi-Viewer', 'Multi-Viewer')
+
+    @staticmethod
+    def load_session():
+        try:
+            return json.loads(MainUI.settings().value('session', '{}'))
+        except (TypeError, ValueError):
+            return {}
+
+    def save_session(self):
+        folders = [button.directory for button in self.btn_label_list]
+        if any(directory is None for directory in folders):
+            return
+        row = self.selected_row()
+        draw_label = self.plot_list[0]
+        session = {
+            'folders': folders,
+            'box': [draw_label.select_rect_width, draw_label.select_rect_height],
+            'ratio': self.slider_enlarge.value(),
+            'page': self.page,
+        }
+        if row is not None:
+            session['selected'] = self.dataset_index.key(row)
+        self.settings().setValue('session', json.dumps(session))
+
     # ------------------------ Event ------------------------ #
-    
+    def closeEvent(self, event):
+        self.save_session()
+        self.shutdown()
+        super().closeEvent(event)
+
+
+
+def batch_main(argv=None):
+    # 无界面批量生成对比图: python main.py batch DIR1 DIR2 ... --box X Y W H --ratio 2 --out OUT
+    import argparse
+    from src.batch_mosaic import run_batch
+
+    parser = argparse.ArgumentParser(prog='main.py batch', description='批量生成对比图')
+    parser.add_argument('dirs', nargs='+', help='对比文件夹, 第一个为真值')
+    parser.add_argument('--box', nargs=4, type=int, required=True, metavar=('X', 'Y', 'W', 'H'),
+                        help='放大区域在原图中的左上角坐标与大小')
+    parser.add_argument('--ratio', type=float, default=2.0, help='放大倍数')
+    parser.add_argument('--out', required=True, help='输出文件夹')
+    parser.add_argument('--format', choices=('png', 'jpg'), default='png')
+    parser.add_argument('--quality', type=int, default=95, help='JPEG 质量')
+    parser.add_argument('--labels', nargs='+', help='各文件夹的标签, 默认为文件夹路径末两级')
+    parser.add_argument('--interpolation', action='store_true', help='放大时插值')
+    parser.add_argument('--cols', type=int, help='每行的图像数')
+    parser.add_argument('--workers', type=int, help='进程数, 默认为CPU核数')
+    args = parser.parse_args(argv)
+
+    if args.labels and len(args.labels) != len(args.dirs):
+        parser.error('--labels 的数量需与文件夹数量一致')
+    ok = run_batch(args.dirs, args.out, tuple(args.box), args.ratio, args.interpolation,
+                   args.labels, args.format, args.quality, args.workers, args.cols)
+    return 0 if ok else 1
 
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'batch':
+        sys.exit(batch_main(sys.argv[2:]))
+
     app = QApplication(sys.argv)
-    gui = MainUI()
-    # gui.show()
+    # python main.py [DIR1 DIR2 ...] [--no-restore], Qt 自身的参数已由 QApplication 移除
+    import argparse
+    parser = argparse.ArgumentParser(prog='main.py', description='多文件夹图像对比')
+    parser.add_argument('dirs', nargs='*', help='对比的文件夹或视频文件, 第一个为真值')
+    parser.add_argument('--no-restore', action='store_true', help='不恢复上次的会话')
+    parser.add_argument('--trace', metavar='FILE', help='记录各阶段耗时, 退出时导出 Chrome trace')
+    args = parser.parse_args(app.arguments()[1:])
+    if len(args.dirs) == 1:
+        parser.error('至少需要两个文件夹')
+    if args.trace:
+        tracer.enable()
+        app.aboutToQuit.connect(lambda: tracer.export_chrome_trace(args.trace))
+    app.main_window = MainUI(args.dirs, restore=not args.no_restore)
     sys.exit(app.exec_())
 
 if __name__ == '__main__':
@@ -0,0 +1,165 @@
+from PyQt5.QtCore import *
+from PyQt5.QtGui import *
+
+from src.image_pyramid import ImagePyramid
+from src.tracing import tracer
+
+
+
+class LoadJob(QRunnable):
+    # 读取并缩放一张图像, 每一步之后检查是否已被更新的选择取代
+    def __init__(self, loader, generation, panel, path, file_name, width, height):
+        super().__init__()
+        self.loader = loader
+        self.generation = generation
+        self.panel = panel
+        self.path = path
+        self.file_name = file_name
+        self.width = width
+        self.height = height
+
+    def run(self):
+        if self.loader.is_stale(self.generation):
+            return
+        prefetcher = self.loader.prefetcher
+        if prefetcher.disk_cache is not None and self.path not in prefetcher.cache:
+            # 内存中没有时先显示磁盘缓存的缩略图
+            with tracer.span('read.thumbnail', path=self.path):
+                thumb = prefetcher.disk_cache.load_thumbnail(self.path)
+            if thumb is not None and not self.loader.is_stale(self.generation):
+                preview = ImagePyramid(thumb)
+                self.loader.preview_ready.emit(self.generation, self.panel, self.file_name,
+                                               preview, preview.scaled(self.width, self.height))
+        image = prefetcher.load(self.path, self.width, self.height)
+        if image is None or self.loader.is_stale(self.generation):
+            return
+        display = image.scaled(self.width, self.height)
+        if self.loader.is_stale(self.generation):
+            return
+        self.loader.image_ready.emit(self.generation, self.panel, self.file_name, image, display)
+
+
+class DiffJob(QRunnable):
+    def __init__(self, loader, generation, gt_path, items, mode='abs', colormap='gray', threshold=None):
+        super().__init__()
+        self.loader = loader
+        self.generation = generation
+        self.gt_path = gt_path
+        self.items = items  # [(panel, path, width, height)]
+        self.mode = mode
+        self.colormap = colormap
+        self.threshold = threshold
+
+    def run(self):
+        if self.loader.is_stale(self.generation):
+            return
+        # 与显示共用已解码的图像, 不再从磁盘重新读取
+        prefetcher = self.loader.prefetcher
+        gt = prefetcher.load(self.gt_path)
+        if gt is None or self.loader.is_stale(self.generation):
+            return
+        images = {path: prefetcher.load(path) for _, path, _, _ in self.items}
+        if self.loader.is_stale(self.generation):
+            return
+        diffs = self.loader.diff_engine.compute(self.gt_path, gt, images, self.mode, self.colormap, self.threshold)
+        if self.loader.is_stale(self.generation):
+            return
+        results = {}
+        for panel, path, width, height in self.items:
+            diff = diffs.get(path)
+            if diff is not None:
+                results[panel] = (diff, diff.scaled(width, height))
+        self.loader.diff_ready.emit(self.generation, results)
+
+
+class RoiJob(QRunnable):
+    # 预先计算各方法与真值的误差积分图, 需要原图分辨率
+    def __init__(self, loader, generation, gt_path, items):
+        super().__init__()
+        self.loader = loader
+        self.generation = generation
+        self.gt_path = gt_path
+        self.items = items  # [(panel, path)]
+
+    def run(self):
+        if self.loader.is_stale(self.generation):
+            return
+        prefetcher = self.loader.prefetcher
+        gt = prefetcher.load(self.gt_path)
+        if gt is None or self.loader.is_stale(self.generation):
+            return
+        images = {path: prefetcher.load(path) for _, path in self.items}
+        if self.loader.is_stale(self.generation):
+            return
+        tables = self.loader.roi_metrics.compute(self.gt_path, gt, images)
+        if self.loader.is_stale(self.generation):
+            return
+        results = {panel: tables[path] for panel, path in self.items if path in tables}
+        self.loader.roi_ready.emit(self.generation, results)
+
+
+class FullResJob(QRunnable):
+    # 放大镜需要的像素超过缩小解码的分辨率时, 在后台补读原图
+    def __init__(self, loader, panel, path, image):
+        super().__init__()
+        self.loader = loader
+        self.panel = panel
+        self.path = path
+        self.image = image
+
+    def run(self):
+        self.loader.prefetcher.ensure_full(self.path, self.image)
+        self.loader.full_ready.emit(self.panel, self.image)
+
+
+class AsyncLoader(QObject):
+    # 每次选择生成一个新的 generation, 旧 generation 的任务在队列中被丢弃, 运行中的任务在检查点退出
+    image_ready = pyqtSignal(int, int, str, object, QImage)  # generation, panel, file_name, ImagePyramid, display
+    preview_ready = pyqtSignal(int, int, str, object, QImage)  # 同上, 来自磁盘缩略图
+    full_ready = pyqtSignal(int, object)  # panel, ImagePyramid
+    diff_ready = pyqtSignal(int, object)  # generation, {panel: (DiffMap, display)}
+    roi_ready = pyqtSignal(int, object)  # generation, {panel: ErrorTables}
+
+    def __init__(self, prefetcher, diff_engine, roi_metrics=None, max_threads=None, parent=None):
+        super().__init__(parent)
+        self.prefetcher = prefetcher
+        self.diff_engine = diff_engine
+        self.roi_metrics = roi_metrics
+        self.generation = 0
+        self.pool = QThreadPool()
+        if max_threads is None:
+            max_threads = max(2, QThread.idealThreadCount())
+        self.pool.setMaxThreadCount(max_threads)
+        # 补读原图的任务不随新的选择清空
+        self.full_pool = QThreadPool()
+        self.full_pool.setMaxThreadCount(2)
+
+    def is_stale(self, generation):
+        return generation != self.generation
+
+    def submit_load(self, items):
+        # items: [(panel, path, file_name, width, height)]
+        self.generation += 1
+        self.pool.clear()
+        for panel, path, file_name, width, height in items:
+            self.pool.start(LoadJob(self, self.generation, panel, path, file_name, width, height))
+        return self.generation
+
+    def submit_diff(self, gt_path, items, mode='abs', colormap='gray', threshold=None):
+        self.pool.start(DiffJob(self, self.generation, gt_path, items, mode, colormap, threshold))
+        return self.generation
+
+    def submit_roi(self, gt_path, items):
+        self.pool.start(RoiJob(self, self.generation, gt_path, items))
+        return self.generation
+
+    def submit_full(self, panel, path, image):
+        # 结果在 GUI 线程中按金字塔对象匹配, 已切换的面板会忽略
+        self.full_pool.start(FullResJob(self, panel, path, image))
+
+    def shutdown(self):
+        self.generation += 1
+        self.pool.clear()
+        self.full_pool.clear()
+        self.pool.waitForDone()
+        self.full_pool.waitForDone()
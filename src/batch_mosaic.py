@@ -0,0 +1,104 @@
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import math
+import os
+import time
+
+from src.image_io import IMAGE_EXTENSIONS
+
+# 与 MainUI.raw_col_dict 相同的排布, 超过6个时按近似正方形排布
+RAW_COL_DICT = {2: (1, 2), 3: (1, 3), 4: (2, 2), 5: (2, 3), 6: (2, 3)}
+
+
+def grid_shape(num):
+    if num in RAW_COL_DICT:
+        return RAW_COL_DICT[num]
+    cols = math.ceil(math.sqrt(num))
+    return math.ceil(num / cols), cols
+
+
+def crop_box(img, x, y, width, height):
+    # 超出图像的部分填充黑色, 与 QImage.copy 的行为一致
+    tile = np.zeros((height, width, 3), np.uint8)
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + width, img.shape[1]), min(y + height, img.shape[0])
+    if x1 > x0 and y1 > y0:
+        tile[y0 - y:y1 - y, x0 - x:x1 - x] = img[y0:y1, x0:x1]
+    return tile
+
+
+def render_mosaic(paths, labels, box, enlarge_ratio, interpolation=False, cols=None):
+    # 与 compare_select_area 相同的网格: 每个文件夹一个放大区域, 下方为文件夹标签
+    import cv2
+    x, y, width, height = box
+    tile_w, tile_h = int(width * enlarge_ratio), int(height * enlarge_ratio)
+    text_h = max(24, tile_h // 10)
+    font_scale = text_h / 40
+    if cols is None:
+        _, cols = grid_shape(len(paths))
+    rows = math.ceil(len(paths) / cols)
+
+    mosaic = np.full((rows * (tile_h + text_h), cols * tile_w, 3), 255, np.uint8)
+    for i, (path, label) in enumerate(zip(paths, labels)):
+        img = cv2.imread(path) if path else None
+        if img is None:
+            tile = np.full((tile_h, tile_w, 3), 128, np.uint8)
+        else:
+            tile = cv2.resize(crop_box(img, x, y, width, height), (tile_w, tile_h),
+                              interpolation=cv2.INTER_CUBIC if interpolation else cv2.INTER_NEAREST)
+        row, col = i // cols, i % cols
+        top, left = row * (tile_h + text_h), col * tile_w
+        mosaic[top:top + tile_h, left:left + tile_w] = tile
+
+        (text_w, text_base), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, font_scale, 1)
+        org = (left + max(0, (tile_w - text_w) // 2), top + tile_h + (text_h + text_base) // 2)
+        cv2.putText(mosaic, label, org, cv2.FONT_HERSHEY_SIMPLEX, font_scale, (0, 0, 0), 1, cv2.LINE_AA)
+    return mosaic
+
+
+def render_task(task):
+    import cv2
+    name, paths, labels, out_path, options = task
+    mosaic = render_mosaic(paths, labels, options['box'], options['enlarge_ratio'],
+                           options['interpolation'], options['cols'])
+    params = [cv2.IMWRITE_JPEG_QUALITY, options['quality']] if out_path.lower().endswith(('.jpg', '.jpeg')) else []
+    return name, cv2.imwrite(out_path, mosaic, params)
+
+
+def folder_label(directory):
+    parts = os.path.normpath(directory).split(os.sep)
+    return '/'.join(parts[-2:])
+
+
+def build_tasks(directories, out_dir, options, labels=None, ext='png'):
+    # 以第一个文件夹中的文件名为准配对, 缺失的文件显示为灰色
+    if labels is None:
+        labels = [folder_label(d) for d in directories]
+    listings = [set(os.listdir(d)) for d in directories]
+    names = sorted(f for f in listings[0] if f.lower().endswith(IMAGE_EXTENSIONS))
+    tasks = []
+    for name in names:
+        paths = [os.path.join(d, name) if name in files else None for d, files in zip(directories, listings)]
+        out_path = os.path.join(out_dir, os.path.splitext(name)[0] + '.' + ext)
+        tasks.append((name, paths, labels, out_path, options))
+    return tasks
+
+
+def run_batch(directories, out_dir, box, enlarge_ratio, interpolation=False, labels=None,
+              ext='png', quality=95, workers=None, cols=None):
+    os.makedirs(out_dir, exist_ok=True)
+    options = {'box': box, 'enlarge_ratio': enlarge_ratio, 'interpolation': interpolation,
+               'quality': quality, 'cols': cols}
+    tasks = build_tasks(directories, out_dir, options, labels, ext)
+
+    start = time.time()
+    failed = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunksize = max(1, len(tasks) // ((workers or os.cpu_count() or 1) * 8))
+        for name, ok in executor.map(render_task, tasks, chunksize=chunksize):
+            if not ok:
+                failed.append(name)
+    print(f"生成 {len(tasks) - len(failed)} 张对比图, 用时 {time.time() - start:.1f}s -> {out_dir}")
+    for name in failed:
+        print('写入失败:', name)
+    return len(failed) == 0
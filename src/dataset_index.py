@@ -0,0 +1,235 @@
+from PyQt5.QtCore import *
+from PyQt5.QtGui import *
+import numpy as np
+import bisect
+import os
+
+from src.image_io import IMAGE_EXTENSIONS, VIRTUAL_SEP, archive_reader
+
+
+def image_key(filename):
+    # 按去掉扩展名的文件名配对, 允许不同文件夹使用不同的图像格式
+    return os.path.splitext(filename)[0]
+
+
+def scan_folder(directory):
+    # os.scandir 一次遍历即可得到文件类型, 不需要对每个文件额外 stat
+    entries = {}
+    with os.scandir(directory) as it:
+        for entry in it:
+            name = entry.name
+            if name.lower().endswith(IMAGE_EXTENSIONS) and entry.is_file():
+                entries[image_key(name)] = name
+    return entries
+
+
+def scan_archive(path):
+    # 压缩包内的图像按去掉公共目录后的相对路径配对, 不同方法的包可以有不同的顶层目录
+    names = [name for name in archive_reader(path).names() if name.lower().endswith(IMAGE_EXTENSIONS)]
+    if not names:
+        return {}
+    # tar 打包当前目录时成员名以 "./" 开头
+    relative = [name[2:] if name.startswith('./') else name for name in names]
+    prefix = os.path.commonpath([os.path.dirname(name) for name in relative])
+    start = len(prefix) + 1 if prefix else 0
+    return {image_key(rel[start:]): name for rel, name in zip(relative, names)}
+
+
+class DatasetIndex:
+    # 所有文件夹按文件名配对后的索引, 每一行对应一个文件名 key
+    def __init__(self, num_of_folder):
+        self.directories = [None] * num_of_folder
+        self.entries = [None] * num_of_folder  # 每个文件夹 {key: filename}
+        self.videos = [None] * num_of_folder  # 视频文件的帧数, 第 k 帧对应第 k 行
+        self.archives = [False] * num_of_folder  # 压缩包的 entries 为包内成员名
+        self.keys = []
+
+    def __len__(self):
+        return len(self.keys)
+
+    def set_folder(self, folder, directory, entries=None):
+        self.directories[folder] = directory
+        self.entries[folder] = scan_folder(directory) if entries is None else entries
+        self.videos[folder] = None
+        self.archives[folder] = False
+        self.rebuild()
+
+    def set_archive(self, folder, path, entries=None):
+        self.directories[folder] = path
+        self.entries[folder] = scan_archive(path) if entries is None else entries
+        self.videos[folder] = None
+        self.archives[folder] = True
+        self.rebuild()
+
+    def set_video(self, folder, path, frame_count):
+        # 视频按位置与图像文件夹的行对齐
+        self.directories[folder] = path
+        self.entries[folder] = None
+        self.videos[folder] = frame_count
+        self.archives[folder] = False
+        self.rebuild()
+
+    def rebuild(self):
+        self.keys = self.collect_keys()
+
+    def collect_keys(self):
+        keys = set()
+        for entries in self.entries:
+            if entries:
+                keys.update(entries)
+        if not keys and any(self.videos):
+            # 只有视频时按帧号生成行
+            keys = {f"{k:06d}" for k in range(max(count or 0 for count in self.videos))}
+        return sorted(keys)
+
+    def has_folder(self, folder):
+        return self.entries[folder] is not None or self.videos[folder] is not None
+
+    def is_video(self, folder):
+        return self.videos[folder] is not None
+
+    def key(self, row):
+        return self.keys[row]
+
+    def row_of(self, key):
+        row = bisect.bisect_left(self.keys, key)
+        if row < len(self.keys) and self.keys[row] == key:
+            return row
+        return None
+
+    def nearest_row(self, key):
+        # key 已被删除时返回其原位置上的行
+        if not self.keys:
+            return None
+        return min(bisect.bisect_left(self.keys, key), len(self.keys) - 1)
+
+    def filename(self, row, folder):
+        if self.videos[folder] is not None:
+            if not 0 <= row < min(self.videos[folder], len(self.keys)):
+                return None
+            return f"{os.path.basename(self.directories[folder])}{VIRTUAL_SEP}{row}"
+        entries = self.entries[folder]
+        if entries is None or not 0 <= row < len(self.keys):
+            return None
+        return entries.get(self.keys[row])
+
+    def path(self, row, folder):
+        filename = self.filename(row, folder)
+        if filename is None:
+            return None
+        if self.videos[folder] is not None:
+            return f"{self.directories[folder]}{VIRTUAL_SEP}{row}"
+        if self.archives[folder]:
+            return f"{self.directories[folder]}{VIRTUAL_SEP}{filename}"
+        return os.path.join(self.directories[folder], filename)
+
+    def missing_folders(self, row):
+        key = self.keys[row]
+        return [i for i, entries in enumerate(self.entries)
+                if (entries is not None and key not in entries)
+                or (self.videos[i] is not None and row >= self.videos[i])]
+
+
+class ImageListModel(QAbstractListModel):
+    # 虚拟列表模型, 只在视图需要时生成可见行的数据, 10万行也不会创建任何条目对象
+    def __init__(self, dataset_index, folder_names, parent=None):
+        super().__init__(parent)
+        self.dataset_index = dataset_index
+        self.folder_names = folder_names  # 可调用对象, 返回各文件夹的显示名
+        self.missing_color = QColor(255, 0, 0)
+        # 排序/筛选: order[模型行] = 索引行, 为空时按文件名顺序显示全部
+        self.order = None
+        self.values = None  # 与 order 对应的分数, 显示在文件名后
+        self._inverse = None
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        if self.order is not None:
+            return len(self.order)
+        return len(self.dataset_index)
+
+    def dataset_row(self, row):
+        if self.order is not None:
+            return int(self.order[row])
+        return row
+
+    def model_row(self, dataset_row):
+        # 索引行在当前排序中的位置, 被筛掉时返回 None
+        if self.order is None:
+            return dataset_row
+        if self._inverse is None:
+            self._inverse = np.full(len(self.dataset_index), -1, np.int64)
+            self._inverse[self.order] = np.arange(len(self.order))
+        row = int(self._inverse[dataset_row]) if dataset_row < len(self._inverse) else -1
+        return row if row >= 0 else None
+
+    def set_order(self, order=None, values=None):
+        self.beginResetModel()
+        self.order = order
+        self.values = values
+        self._inverse = None
+        self.endResetModel()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        model_row = index.row()
+        row = self.dataset_row(model_row)
+        if role == Qt.DisplayRole:
+            name = self.dataset_index.filename(row, 0) or self.dataset_index.key(row)
+            if self.values is not None:
+                return f"{name}  {self.values[model_row]:.4g}"
+            return name
+        if role == Qt.ForegroundRole:
+            if self.dataset_index.missing_folders(row):
+                return self.missing_color
+        elif role == Qt.ToolTipRole:
+            missing = self.dataset_index.missing_folders(row)
+            if missing:
+                names = self.folder_names()
+                return '缺少: ' + ', '.join(names[i] for i in missing)
+        return None
+
+    def refresh(self):
+        # 索引变化后原有的排序失效
+        self.set_order()
+
+    def update_folder(self, folder, entries):
+        # 增量更新一个文件夹: 只对增删的行发出删除/插入信号, 视图保留选择与滚动位置
+        dataset_index = self.dataset_index
+        dataset_index.entries[folder] = entries
+        new_keys = dataset_index.collect_keys()
+        if self.order is not None:
+            dataset_index.keys = new_keys
+            self.refresh()
+            return
+        keys = dataset_index.keys
+        added = set(new_keys)
+        removed = [row for row, key in enumerate(keys) if key not in added]
+        # 从后往前按连续区间删除, 前面的行号保持不变
+        while removed:
+            last = first = removed.pop()
+            while removed and removed[-1] == first - 1:
+                first = removed.pop()
+            self.beginRemoveRows(QModelIndex(), first, last)
+            del keys[first:last + 1]
+            self.endRemoveRows()
+        # 此时 keys 是 new_keys 的子序列, 顺序合并并按连续区间插入
+        row = i = 0
+        while i < len(new_keys):
+            if row < len(keys) and keys[row] == new_keys[i]:
+                row += 1
+                i += 1
+                continue
+            j = i
+            while j < len(new_keys) and not (row < len(keys) and keys[row] == new_keys[j]):
+                j += 1
+            self.beginInsertRows(QModelIndex(), row, row + j - i - 1)
+            keys[row:row] = new_keys[i:j]
+            self.endInsertRows()
+            row += j - i
+            i = j
+        # 已有行的缺失状态可能变化
+        if keys:
+            self.dataChanged.emit(self.index(0), self.index(len(keys) - 1), [Qt.ForegroundRole, Qt.ToolTipRole])
@@ -0,0 +1,214 @@
+from PyQt5.QtGui import *
+from collections import OrderedDict
+from functools import partial
+import numpy as np
+import threading
+
+from src.image_io import array_qimage, as_rgb32, qimage_to_array
+from src.image_pyramid import ImagePyramid
+from src.tracing import tracer
+
+# BGR 顺序的灰度权重, 与 cv2.COLOR_BGR2GRAY 一致
+GRAY_WEIGHTS = np.array([0.114, 0.587, 0.299], dtype=np.float32)
+
+# 差异模式: 绝对差的灰度, 带符号的亮度差, 分通道绝对差, 超过阈值的二值图, 亮度的绝对差
+DIFF_MODES = {
+    'abs': "绝对差",
+    'signed': "带符号",
+    'channel': "分通道",
+    'threshold': "阈值",
+    'luminance': "亮度差",
+}
+COLORMAPS = {
+    'gray': "灰度",
+    'jet': "Jet",
+    'inferno': "Inferno",
+    'turbo': "Turbo",
+    'coolwarm': "蓝-白-红",
+}
+_CV_COLORMAPS = {'jet': 'COLORMAP_JET', 'inferno': 'COLORMAP_INFERNO', 'turbo': 'COLORMAP_TURBO'}
+_luts = {}
+
+
+def colormap_lut(name):
+    # (256, 4) 的 BGRA 查找表, 按名字缓存
+    lut = _luts.get(name)
+    if lut is None:
+        ramp = np.arange(256, dtype=np.uint8)
+        if name in _CV_COLORMAPS:
+            import cv2
+            bgr = cv2.applyColorMap(ramp.reshape(256, 1), getattr(cv2, _CV_COLORMAPS[name])).reshape(256, 3)
+        elif name == 'coolwarm':
+            # 发散色表, 128 (无差异) 为白色, 适合带符号的差异
+            t = np.abs(ramp.astype(np.float32) - 128) / 128
+            fade = (255 * (1 - t)).astype(np.uint8)
+            full = np.full(256, 255, np.uint8)
+            low = ramp < 128
+            bgr = np.stack([np.where(low, full, fade), fade, np.where(low, fade, full)], axis=1)
+        else:
+            bgr = np.repeat(ramp.reshape(256, 1), 3, axis=1)
+        lut = np.concatenate([bgr, np.full((256, 1), 255, np.uint8)], axis=1)
+        _luts[name] = lut
+    return lut
+
+
+def mode_key(mode, threshold=None):
+    # 缓存键中的模式, 阈值模式的结果与阈值有关
+    return (mode, threshold) if mode == 'threshold' else mode
+
+
+class DiffMap(ImagePyramid):
+    # 差异图: 保存 0-255 的索引图, 显示图像由颜色表查表得到, 切换颜色表不需要重新计算差异
+    # 分通道模式的索引图为 (h, w, 3) BGR, 直接按颜色显示
+    def __init__(self, index, mode, colormap='gray'):
+        self.index = index
+        self.mode = mode
+        self.colormap = colormap
+        super().__init__(self.render())
+
+    def render(self):
+        if self.index.ndim == 3:
+            import cv2
+            return array_qimage(cv2.cvtColor(self.index, cv2.COLOR_BGR2BGRA), QImage.Format_RGB32)
+        if self.colormap == 'gray':
+            # 灰度直接引用索引图, 不额外占用内存
+            return array_qimage(self.index, QImage.Format_Grayscale8)
+        return array_qimage(np.take(colormap_lut(self.colormap), self.index, axis=0), QImage.Format_RGB32)
+
+    def nbytes(self):
+        shared = self.index.ndim == 2 and self.colormap == 'gray'
+        return super().nbytes() + (0 if shared else self.index.nbytes)
+
+    def set_colormap(self, colormap):
+        # 返回显示是否改变
+        if colormap == self.colormap:
+            return False
+        before = self.nbytes()
+        self.colormap = colormap
+        if self.index.ndim == 3:
+            return False
+        image = self.render()
+        with self._lock:
+            self.levels = [image]
+        # 灰度直接引用索引图, 与彩色之间切换时占用的内存也随之改变
+        if self.on_resize is not None:
+            self.on_resize(self, self.nbytes() - before)
+        return True
+
+
+def compute_index_maps(mode, stack, gt_arr, threshold=None):
+    # stack: (n, h, w, 3) uint8, gt_arr: (h, w, 3) uint8, 返回 (n, h, w) 或 (n, h, w, 3) uint8
+    # 除阈值模式外, 同一批次的所有方法共享归一化范围, 颜色可直接比较
+    if mode in ('signed', 'luminance'):
+        values = stack @ GRAY_WEIGHTS
+        values -= gt_arr @ GRAY_WEIGHTS
+        if mode == 'signed':
+            # 以 128 为零点, 按最大绝对值对称缩放
+            peak = float(np.abs(values).max())
+            values *= 127.0 / peak if peak > 0 else 0.0
+            values += 128.0
+            return np.clip(values, 0, 255).astype(np.uint8)
+        np.abs(values, out=values)
+        return normalize(values)
+    # |a - b| 在 uint8 下计算, 避免转换为有符号类型的额外拷贝
+    diff = np.maximum(stack, gt_arr) - np.minimum(stack, gt_arr)
+    if mode == 'channel':
+        peak = int(diff.max())
+        if peak == 0:
+            return diff
+        lut = np.minimum(np.arange(256) * 255 // peak, 255).astype(np.uint8)
+        import cv2
+        return cv2.LUT(diff.reshape(-1, 3), lut).reshape(diff.shape)
+    gray = diff @ GRAY_WEIGHTS
+    del diff
+    if mode == 'threshold':
+        return np.where(gray > (threshold or 0), 255, 0).astype(np.uint8)
+    return normalize(gray)
+
+
+def normalize(values):
+    # 按 min/max 线性拉伸到 0-255
+    min_val = values.min()
+    max_val = values.max()
+    if max_val > min_val:
+        values -= min_val
+        values *= 255.0 / (max_val - min_val)
+    else:
+        values[:] = 0
+    return values.astype(np.uint8)
+
+
+class DiffEngine:
+    # 复用已解码的图像计算与真值的差异图, 所有方法一次批量计算并共享归一化
+    # 结果按 (真值路径, 图像路径, 模式) 缓存, 反复切换模式或开关 btn_diff 不会重复计算, 切换颜色表只重新查表
+    # 缓存大小由 MemoryManager 统一管理, 被淘汰的差异图在下次需要时重新计算
+    def __init__(self, memory_manager):
+        self.memory_manager = memory_manager
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, gt_path, path, mode='abs'):
+        key = (gt_path, path, mode)
+        with self._lock:
+            diff = self._cache.get(key)
+            if diff is not None:
+                self._cache.move_to_end(key)
+        if diff is not None:
+            self.memory_manager.touch(diff)
+        return diff
+
+    def put(self, gt_path, path, diff):
+        key = (gt_path, path, diff.mode)
+        with self._lock:
+            self._cache[key] = diff
+            self._cache.move_to_end(key)
+        diff.on_resize = self.memory_manager.adjust
+        self.memory_manager.register(diff, release=partial(self.remove, key),
+                                     trim=ImagePyramid.evict_levels)
+
+    def remove(self, key):
+        with self._lock:
+            return self._cache.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            diffs = list(self._cache.values())
+            self._cache.clear()
+        for diff in diffs:
+            self.memory_manager.unregister(diff)
+
+    def compute(self, gt_path, gt, images, mode='abs', colormap='gray', threshold=None):
+        # images: {path: ImagePyramid}, 返回 {path: DiffMap}
+        key = mode_key(mode, threshold)
+        results = {path: self.get(gt_path, path, key) for path in images}
+        for diff in results.values():
+            if diff is not None:
+                diff.set_colormap(colormap)
+        if all(diff is not None for diff in results.values()):
+            return results
+
+        gt_image = as_rgb32(gt.level(0))
+        gt_arr = qimage_to_array(gt_image)[..., :3]
+        # 尺寸与真值不同的图像无法逐像素比较, 跳过
+        # 按块读取的超大图像没有完整的原图像素, 同样跳过
+        paths = [path for path, image in images.items()
+                 if image is not None and not image.tiled
+                 and image.width() == gt.width() and image.height() == gt.height()]
+        if not paths or gt.tiled:
+            return results
+        method_images = [as_rgb32(images[path].level(0)) for path in paths]
+
+        # 中间数组: 堆叠的输入与差值 (uint8 x3 x2), 灰度图 (float32), 索引图 (uint8 x3)
+        pixels = len(paths) * gt.width() * gt.height()
+        with self.memory_manager.transient(pixels * (3 + 3 + 4 + 3)):
+            with tracer.span('diff', mode=mode, count=len(paths)):
+                stack = np.stack([qimage_to_array(image)[..., :3] for image in method_images])
+                with tracer.span('diff.normalize', mode=mode):
+                    index_maps = compute_index_maps(mode, stack, gt_arr, threshold)
+                del stack
+
+        for path, index in zip(paths, index_maps):
+            diff = DiffMap(np.ascontiguousarray(index), key, colormap)
+            self.put(gt_path, path, diff)
+            results[path] = diff
+        return results
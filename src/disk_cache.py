@@ -0,0 +1,144 @@
+from PyQt5.QtCore import *
+from PyQt5.QtGui import *
+import hashlib
+import json
+import os
+import threading
+
+from src.image_io import split_virtual
+
+
+def default_cache_dir():
+    base = QStandardPaths.writableLocation(QStandardPaths.GenericCacheLocation)
+    if not base:
+        base = os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'multi-viewer')
+
+
+def _digest(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class DiskCache:
+    # 磁盘缓存: 文件夹索引以 (路径, 文件夹 mtime) 为键, 缩略图以 (文件路径, mtime, 大小) 为键
+    # 总大小超过 max_bytes 时按最近访问时间淘汰
+    def __init__(self, root=None, max_bytes=512 * 1024 * 1024, thumb_size=512):
+        self.root = root or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.thumb_size = thumb_size
+        self.index_dir = os.path.join(self.root, 'index')
+        self.thumb_dir = os.path.join(self.root, 'thumbs')
+        os.makedirs(self.index_dir, exist_ok=True)
+        os.makedirs(self.thumb_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.evict_every = 64
+        threading.Thread(target=self.evict, daemon=True).start()
+
+    # ----------------------- Index ---------------------- #
+    def index_path(self, directory):
+        return os.path.join(self.index_dir, _digest(os.path.abspath(directory)) + '.json')
+
+    def load_index(self, directory):
+        # 文件夹的 mtime 在增删文件时改变, 未变化时直接使用缓存的文件列表
+        try:
+            mtime_ns = os.stat(directory).st_mtime_ns
+            with open(self.index_path(directory), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get('directory') != os.path.abspath(directory) or data.get('mtime_ns') != mtime_ns:
+            return None
+        self._touch(self.index_path(directory))
+        return data['entries']
+
+    def save_index(self, directory, entries):
+        try:
+            mtime_ns = os.stat(directory).st_mtime_ns
+        except OSError:
+            return
+        data = {'directory': os.path.abspath(directory), 'mtime_ns': mtime_ns, 'entries': entries}
+        self._write(self.index_path(directory), json.dumps(data).encode('utf-8'))
+
+    # ----------------------- Thumbnail ---------------------- #
+    def thumb_path(self, path):
+        # 只读取文件元数据, 不打开原图; 视频帧与压缩包成员使用容器文件的元数据
+        try:
+            st = os.stat(split_virtual(path)[0])
+        except OSError:
+            return None
+        digest = _digest(f"{os.path.abspath(path)}|{st.st_mtime_ns}|{st.st_size}")
+        return os.path.join(self.thumb_dir, digest[:2], digest + '.jpg')
+
+    def load_thumbnail(self, path):
+        thumb_path = self.thumb_path(path)
+        if thumb_path is None or not os.path.exists(thumb_path):
+            return None
+        image = QImage(thumb_path)
+        if image.isNull():
+            return None
+        self._touch(thumb_path)
+        return image
+
+    def save_thumbnail(self, path, pyramid):
+        thumb_path = self.thumb_path(path)
+        if thumb_path is None or os.path.exists(thumb_path):
+            return
+        if max(pyramid.width(), pyramid.height()) > self.thumb_size:
+            image = pyramid.scaled(self.thumb_size, self.thumb_size)
+        else:
+            image = pyramid.level(0)
+        buffer = QBuffer()
+        buffer.open(QIODevice.WriteOnly)
+        if image.save(buffer, 'JPG', 90):
+            self._write(thumb_path, bytes(buffer.data()))
+
+    # ----------------------- Eviction ---------------------- #
+    def _touch(self, path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _write(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再替换, 避免并发读到不完整的文件
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            return
+        with self._lock:
+            self._writes += 1
+            evict = self._writes % self.evict_every == 0
+        if evict:
+            self.evict()
+
+    def evict(self):
+        with self._lock:
+            files = []
+            total = 0
+            for dirpath, _, filenames in os.walk(self.root):
+                for name in filenames:
+                    path = os.path.join(dirpath, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    files.append((st.st_mtime, st.st_size, path))
+                    total += st.st_size
+            if total <= self.max_bytes:
+                return
+            # 淘汰到上限的 90%, 避免每次写入都触发
+            files.sort()
+            for _, size, path in files:
+                if total <= self.max_bytes * 0.9:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
@@ -2,11 +2,14 @@ from PyQt5.QtWidgets import *
 from PyQt5.QtGui import *
 from PyQt5.QtCore import *
 
+from src.tracing import tracer
+
 class DrawLabel(QLabel):
     zoom_rect_moved_signal = pyqtSignal(int, int)
     zoom_area_captured_signal = pyqtSignal(QPixmap)
     mouse_tracking_signal = pyqtSignal(bool)
     comparison_ready_signal = pyqtSignal(bool)
+    full_resolution_signal = pyqtSignal()
 
     # ------------------------ Init ------------------------- #
     def __init__(self, select_rect_width=100, select_rect_height=100, enlarge_ratio=2.0):
@@ -27,9 +30,18 @@ class DrawLabel(QLabel):
         ## 原图与缩放图的比例
         self.scale_ratio = 1
         self.file_name = None
-        self.origin_image = None  # 用于存储原图
+        self.origin_image = None  # 用于存储原图 (ImagePyramid)
+        self.image_path = None
         self.diff_map = None # 用于存储差异图
+        self.diff_mode = False # 显示差异图时放大镜也从差异图截取
+        self.error_tables = None # 与真值的误差积分图, 用于放大框内的区域指标
+        self.roi_stats = None # 当前放大框的 (mse, mae, psnr)
         self.zoomed_area_pixmap = None # 放大区域
+        self.zoom_buffer = None # 复用的放大区域缓冲
+        self.render_scheduler = None # 由 MainUI 设置, 为空时立即重绘
+        self.memory_manager = None # 由 MainUI 设置, 记录面板持有的图像内存
+        self.generation = 0 # 当前显示内容对应的加载批次
+        self.loading = False # 是否正在加载新图像
         
         self.setMouseTracking(self.mouse_tracking_flag)
         
@@ -71,20 +83,88 @@ class DrawLabel(QLabel):
         zoom_scaled_rect_height = int(self.select_rect_height * self.scale_ratio)
 
         
-        if self.origin_image and self.origin_image.width() > adjusted_x > 0 and self.origin_image.height() > adjusted_y > 0:
-            rect = QRect(adjusted_x - zoom_scaled_rect_width // 2, 
-                         adjusted_y - zoom_scaled_rect_height // 2,
-                         zoom_scaled_rect_width,
-                         zoom_scaled_rect_height)
-            zoom_area = self.origin_image.copy(rect)
+        # 差异模式下从差异图截取, 坐标系与原图一致
+        source = self.diff_map if self.diff_mode and self.diff_map is not None else self.origin_image
+        if source and source.width() > adjusted_x > 0 and source.height() > adjusted_y > 0:
+            rect = QRectF(int(adjusted_x) - zoom_scaled_rect_width // 2, 
+                          int(adjusted_y) - zoom_scaled_rect_height // 2,
+                          zoom_scaled_rect_width,
+                          zoom_scaled_rect_height)
+            # 积分图查表, 与放大框大小无关
+            if self.error_tables is not None:
+                self.roi_stats = self.error_tables.box(rect.x(), rect.y(), rect.width(), rect.height())
             # self.zoom_area_captured_signal.emit(zoom_area)
-            if self.zoom_interpolation_flag:
-                # 设置插值
-                self.zoomed_area_pixmap = zoom_area.scaled(self.zoom_area_width, self.zoom_area_height, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-            else:
-                self.zoomed_area_pixmap = zoom_area.scaled(self.zoom_area_width, self.zoom_area_height, Qt.KeepAspectRatio)  # 更新属性并缩放
+            # 直接绘制到复用的缓冲中, 省去 copy + scaled 的两次分配
+            if self.zoom_buffer is None or self.zoom_buffer.width() != self.zoom_area_width \
+                    or self.zoom_buffer.height() != self.zoom_area_height:
+                self.zoom_buffer = QPixmap(self.zoom_area_width, self.zoom_area_height)
+                self.account_memory()
+            self.zoom_buffer.fill(self.colors['black'])
+            painter = QPainter(self.zoom_buffer)
+            # 设置插值
+            painter.setRenderHint(QPainter.SmoothPixmapTransform, self.zoom_interpolation_flag)
+            # 缩小解码的图像不足以提供放大区域的像素时, 请求后台读取原图
+            if not source.covers(self.zoom_area_width / max(zoom_scaled_rect_width, 1)) \
+                    and not source.full_requested:
+                source.full_requested = True
+                self.full_resolution_signal.emit()
+            # 放大区域小于源矩形时从金字塔的较低分辨率层截取
+            source.draw_region(painter, QRectF(0, 0, self.zoom_area_width, self.zoom_area_height), rect)
+            painter.end()
+            self.zoomed_area_pixmap = self.zoom_buffer
             
             
+    def set_origin_image(self, image):
+        # 正在显示的图像 pin 住, 不会被内存管理器淘汰
+        if self.memory_manager is not None:
+            self.memory_manager.unpin(self.origin_image)
+            self.memory_manager.pin(image)
+        self.origin_image = image
+
+    def set_diff_map(self, diff_map):
+        if self.memory_manager is not None:
+            self.memory_manager.unpin(self.diff_map)
+            self.memory_manager.pin(diff_map)
+        self.diff_map = diff_map
+
+    def set_error_tables(self, tables):
+        if self.memory_manager is not None:
+            self.memory_manager.unpin(self.error_tables)
+            self.memory_manager.pin(tables)
+        self.error_tables = tables
+        self.roi_stats = None
+
+    def nbytes(self):
+        # 面板自身持有的显示图与放大区域缓冲
+        total = 0
+        for pixmap in (self.pixmap(), self.zoom_buffer):
+            if pixmap is not None and not pixmap.isNull():
+                total += pixmap.width() * pixmap.height() * pixmap.depth() // 8
+        return total
+
+    def account_memory(self):
+        if self.memory_manager is not None:
+            self.memory_manager.register(self)
+
+    def setPixmap(self, pixmap):
+        super().setPixmap(pixmap)
+        self.account_memory()
+
+    def clear_image(self):
+        self.file_name = None
+        self.set_origin_image(None)
+        self.image_path = None
+        self.set_diff_map(None)
+        self.set_error_tables(None)
+        self.zoomed_area_pixmap = None
+        self.loading = False
+        self.setPixmap(QPixmap())
+
+    def set_loading(self, flag):
+        # 加载期间保留旧图像并覆盖提示, 避免快速切换时闪烁
+        self.loading = flag
+        self.update()
+
     def set_zoom_interpolation(self, flag):
         self.zoom_interpolation_flag = flag
 
@@ -107,33 +187,58 @@ class DrawLabel(QLabel):
         self.zoom_area_height = int(self.select_rect_height * self.enlarge_ratio)
         
     def update_status(self):
+        # 交给 RenderScheduler 合并到下一帧
+        if self.render_scheduler is not None:
+            self.render_scheduler.request(self)
+        else:
+            self.render_frame()
+
+    def render_frame(self):
         self.update_box()
-        self.capture_zoom_area()
-        self.repaint()
+        with tracer.span('zoom.capture'):
+            self.capture_zoom_area()
+        self.update()
         
     # ------------------------ Event ------------------------ #
     def paintEvent(self, event):
-        super().paintEvent(event)
-        painter = QPainter(self)
-        painter.setPen(self.pen)
-        rect = QRect(self.mouse_x - self.select_rect_width // 2, self.mouse_y - self.select_rect_height // 2,
-                     self.select_rect_width, self.select_rect_height)
-        painter.drawRect(rect)
+        with tracer.span('paint'):
+            super().paintEvent(event)
+            painter = QPainter(self)
+            painter.setPen(self.pen)
+            rect = QRect(self.mouse_x - self.select_rect_width // 2, self.mouse_y - self.select_rect_height // 2,
+                         self.select_rect_width, self.select_rect_height)
+            painter.drawRect(rect)
         
-        # 绘制放大区域的图像
-        if self.zoomed_area_pixmap:
-            # painter.drawPixmap(self.mouse_x - self.zoom_area_width // 2, self.mouse_y - self.zoom_area_height // 2, self.zoomed_area_pixmap)
-            if (self.mouse_x - self.select_rect_width//2) > self.zoom_area_width or (self.mouse_y - self.select_rect_height//2) > self.zoom_area_height:
-                painter.drawPixmap(0, 0, self.zoomed_area_pixmap)
-            else:
-                painter.drawPixmap(self.width() - self.zoom_area_width, self.height() - self.zoom_area_height, self.zoomed_area_pixmap)
+            # 绘制放大区域的图像
+            if self.zoomed_area_pixmap:
+                # painter.drawPixmap(self.mouse_x - self.zoom_area_width // 2, self.mouse_y - self.zoom_area_height // 2, self.zoomed_area_pixmap)
+                if (self.mouse_x - self.select_rect_width//2) > self.zoom_area_width or (self.mouse_y - self.select_rect_height//2) > self.zoom_area_height:
+                    painter.drawPixmap(0, 0, self.zoomed_area_pixmap)
+                else:
+                    painter.drawPixmap(self.width() - self.zoom_area_width, self.height() - self.zoom_area_height, self.zoomed_area_pixmap)
+
+            # 区域指标, 显示在面板底部
+            if self.roi_stats is not None:
+                mse, mae, psnr = self.roi_stats
+                text = f"PSNR {psnr:.2f} dB  MSE {mse:.2f}  MAE {mae:.2f}"
+                text_rect = QRect(0, self.height() - 24, self.width(), 24)
+                painter.fillRect(text_rect, QColor(0, 0, 0, 160))
+                painter.setPen(self.colors['white'])
+                painter.drawText(text_rect, Qt.AlignCenter, text)
+
+            # 加载占位
+            if self.loading:
+                painter.fillRect(self.rect(), QColor(0, 0, 0, 80))
+                painter.setPen(self.colors['white'])
+                painter.drawText(self.rect(), Qt.AlignCenter, '加载中...')
+            painter.end()
 
     def mouseMoveEvent(self, event):
         # 鼠标移动事件
         self.mouse_x = event.x()
         self.mouse_y = event.y()
         self.zoom_rect_moved_signal.emit(self.mouse_x, self.mouse_y)  # 发出信号
-        self.capture_zoom_area()
+        self.update_status()
         # self.repaint()
         
     def mousePressEvent(self, event):
@@ -0,0 +1,95 @@
+from PyQt5.QtWidgets import *
+from PyQt5.QtGui import *
+from PyQt5.QtCore import *
+import pyqtgraph as pg
+
+# 绘图背景, 在第一次使用缩放视图时才导入 pyqtgraph
+pg.setConfigOption('background', '#FFFFFF')
+pg.setConfigOptions(antialias=True)
+
+
+class PyramidItem(pg.GraphicsObject):
+    # 在原图像素坐标系中绘制 ImagePyramid, 只绘制可见区域, 按当前缩放选择金字塔层
+    def __init__(self, panel):
+        super().__init__()
+        self.panel = panel
+        self.image = None
+        self.smooth = False
+        # 让 exposedRect 只包含需要重绘的区域
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption)
+
+    def set_image(self, image):
+        self.prepareGeometryChange()
+        self.image = image
+        self.update()
+
+    def boundingRect(self):
+        if self.image is None:
+            return QRectF()
+        return QRectF(0, 0, self.image.width(), self.image.height())
+
+    def paint(self, painter, option, widget=None):
+        if self.image is None:
+            return
+        source = option.exposedRect.intersected(self.boundingRect())
+        if source.isEmpty():
+            return
+        # 在设备坐标系中绘制, draw_region 据此选择分辨率刚好足够的层
+        target = painter.transform().mapRect(source)
+        scale = target.width() / source.width()
+        if not self.image.covers(scale) and not self.image.full_requested:
+            self.image.full_requested = True
+            self.panel.full_resolution_signal.emit(self.panel.items.index(self))
+        painter.save()
+        painter.resetTransform()
+        # 放大到像素级时默认不插值, 可以看清每个像素
+        painter.setRenderHint(QPainter.SmoothPixmapTransform, self.smooth)
+        self.image.draw_region(painter, target, source)
+        painter.restore()
+
+
+class GraphPanel(pg.GraphicsLayoutWidget):
+    # QLabel 面板之外的另一种显示方式: 所有视图共享同一个视图变换, 滚轮缩放, 拖动平移
+    full_resolution_signal = pyqtSignal(int)
+
+    def __init__(self, num_of_folder, num_of_col, parent=None):
+        super().__init__(parent)
+        self.views = []
+        self.items = []
+        self.visible = []
+        for i in range(num_of_folder):
+            view = pg.ViewBox(lockAspect=True, invertY=True, enableMenu=False)
+            # 最多放大到视图中只剩几个像素
+            view.setLimits(minXRange=4, minYRange=4)
+            item = PyramidItem(self)
+            view.addItem(item)
+            if self.views:
+                view.setXLink(self.views[0])
+                view.setYLink(self.views[0])
+            self.views.append(view)
+            self.items.append(item)
+        self.set_folders(list(range(num_of_folder)), num_of_col)
+
+    def set_folders(self, folders, num_of_col):
+        # 分页时只有可见的视图在布局中, 其余视图不参与绘制
+        for i in self.visible:
+            self.ci.removeItem(self.views[i])
+        for slot, i in enumerate(folders):
+            self.ci.addItem(self.views[i], row=slot // num_of_col, col=slot % num_of_col)
+        self.visible = list(folders)
+
+    def set_image(self, i, image):
+        # 图像尺寸变化时重新适应窗口, 同尺寸的图像之间切换保持当前视图
+        item = self.items[i]
+        old_rect = item.boundingRect()
+        item.set_image(image)
+        if image is not None and item.boundingRect() != old_rect:
+            self.views[0].setRange(item.boundingRect(), padding=0)
+
+    def refresh(self, i):
+        self.items[i].update()
+
+    def set_smooth(self, flag):
+        for item in self.items:
+            item.smooth = flag
+            item.update()
@@ -0,0 +1,51 @@
+from collections import OrderedDict
+from functools import partial
+import threading
+
+from src.image_pyramid import ImagePyramid
+
+
+class ImageCache:
+    # 已解码图像金字塔的LRU缓存, 字节预算由 MemoryManager 统一管理
+    # 内存紧张时先丢弃最久未使用图像的金字塔层, 仍不够再整张淘汰, 下次访问时重新解码
+    def __init__(self, memory_manager):
+        self.memory_manager = memory_manager
+        self._images = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._images
+
+    def __len__(self):
+        with self._lock:
+            return len(self._images)
+
+    def get(self, key):
+        with self._lock:
+            pyramid = self._images.get(key)
+            if pyramid is not None:
+                self._images.move_to_end(key)
+        if pyramid is not None:
+            self.memory_manager.touch(pyramid)
+        return pyramid
+
+    def put(self, key, pyramid):
+        if pyramid is None:
+            return
+        with self._lock:
+            self._images[key] = pyramid
+        pyramid.on_resize = self.memory_manager.adjust
+        self.memory_manager.register(pyramid, release=partial(self.remove, key),
+                                     trim=ImagePyramid.evict_levels)
+
+    def remove(self, key):
+        with self._lock:
+            return self._images.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            images = list(self._images.values())
+            self._images.clear()
+        for pyramid in images:
+            self.memory_manager.unregister(pyramid)
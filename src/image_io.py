@@ -0,0 +1,319 @@
+from PyQt5.QtCore import *
+from PyQt5.QtGui import *
+from PyQt5 import sip
+import numpy as np
+import threading
+import tarfile
+import zipfile
+import io
+import os
+# cv2 在各函数中首次用到时才导入, 约 50 ms 不计入启动时间; OpenEXR 解码需在导入之前开启
+os.environ.setdefault('OPENCV_IO_ENABLE_OPENEXR', '1')
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tif', '.tiff', '.npy', '.exr')
+JPEG_EXTENSIONS = ('.jpg', '.jpeg')
+# 16位/浮点数据, 显示时经窗宽窗位映射到8位
+HIGH_DEPTH_EXTENSIONS = ('.npy', '.exr')
+HIGH_DEPTH_FORMATS = (QImage.Format_RGBX64, QImage.Format_RGBA64,
+                      QImage.Format_RGBA64_Premultiplied, QImage.Format_Grayscale16)
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv')
+ARCHIVE_EXTENSIONS = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+# 损坏或扩展名不符的压缩包在打开或读取成员时抛出的异常
+ARCHIVE_ERRORS = (tarfile.TarError, zipfile.BadZipFile, EOFError, OSError)
+# 虚拟路径 "容器路径::成员", 视频的成员为帧号, 压缩包的成员为包内文件名
+VIRTUAL_SEP = '::'
+
+
+
+def reduced_flags(factor):
+    # OpenCV 在 DCT 阶段按 1/2, 1/4, 1/8 缩小解码 JPEG, 忽略 EXIF 方向以与 QImage 一致
+    import cv2
+    reduced = {8: cv2.IMREAD_REDUCED_COLOR_8, 4: cv2.IMREAD_REDUCED_COLOR_4, 2: cv2.IMREAD_REDUCED_COLOR_2}
+    return reduced[factor] | cv2.IMREAD_IGNORE_ORIENTATION
+
+
+def is_video(path):
+    return path.lower().endswith(VIDEO_EXTENSIONS)
+
+
+def is_archive(path):
+    return path.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def split_virtual(path):
+    # 返回 (容器路径, 成员), 普通文件的成员为 None
+    container, sep, member = path.rpartition(VIRTUAL_SEP)
+    if not sep:
+        return path, None
+    return container, member
+
+
+_captures = {}  # 视频路径 -> (VideoCapture, Lock), 随机读取帧时复用
+_captures_lock = threading.Lock()
+
+
+def video_frame_count(path):
+    import cv2
+    capture = cv2.VideoCapture(path)
+    count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT)) if capture.isOpened() else 0
+    capture.release()
+    return count
+
+
+def read_video_frame(path, index):
+    # 随机读取一帧 (BGR), 顺序播放应直接使用 VideoCapture.read
+    import cv2
+    with _captures_lock:
+        if path not in _captures:
+            _captures[path] = (cv2.VideoCapture(path), threading.Lock())
+        capture, lock = _captures[path]
+    with lock:
+        if int(capture.get(cv2.CAP_PROP_POS_FRAMES)) != index:
+            capture.set(cv2.CAP_PROP_POS_FRAMES, index)
+        ok, frame = capture.read()
+    return frame if ok else None
+
+
+class ArchiveReader:
+    # 压缩包成员的随机读取, 不解压到磁盘
+    # zip 由中央目录直接定位成员; 未压缩的 tar 记录每个成员的数据偏移, 之后用 os.pread 读取, 多线程无需加锁
+    # 整体压缩的 tar (.tar.gz 等) 无法随机定位, 只能在锁内顺序解压
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.fd = None
+        self.tar = None
+        self.offsets = None
+        if zipfile.is_zipfile(path):
+            self.zip = zipfile.ZipFile(path)
+            return
+        self.zip = None
+        self.tar = tarfile.open(path)
+        if isinstance(self.tar.fileobj, io.BufferedReader):
+            # 未压缩: 只遍历一次文件头建立偏移表
+            self.offsets = {info.name: (info.offset_data, info.size)
+                            for info in self.tar.getmembers() if info.isfile()}
+            self.fd = os.open(path, os.O_RDONLY)
+            self.tar.close()
+            self.tar = None
+
+    def names(self):
+        if self.zip is not None:
+            return [info.filename for info in self.zip.infolist() if not info.is_dir()]
+        if self.offsets is not None:
+            return list(self.offsets)
+        with self.lock:
+            return [info.name for info in self.tar.getmembers() if info.isfile()]
+
+    def read(self, member, size=-1):
+        # size >= 0 时只读取开头的 size 字节, 用于解析文件头
+        if self.zip is not None:
+            with self.zip.open(member) as f:
+                return f.read(size)
+        if self.offsets is not None:
+            offset, length = self.offsets[member]
+            return os.pread(self.fd, length if size < 0 else min(size, length), offset)
+        with self.lock:
+            f = self.tar.extractfile(member)
+            return f.read(size) if f is not None else b''
+
+
+_archives = {}  # 压缩包路径 -> ArchiveReader, 成员表只建立一次
+_archives_lock = threading.Lock()
+
+
+def archive_reader(path):
+    with _archives_lock:
+        reader = _archives.get(path)
+        if reader is None:
+            reader = _archives[path] = ArchiveReader(path)
+        return reader
+
+
+def archive_member(path):
+    # 压缩包成员的虚拟路径返回 (压缩包, 成员), 否则返回 None
+    container, member = split_virtual(path)
+    if member is not None and is_archive(container):
+        return container, member
+    return None
+
+
+def read_archive_member(path, size=-1):
+    container, member = archive_member(path)
+    try:
+        return archive_reader(container).read(member, size)
+    except ARCHIVE_ERRORS + (KeyError,):
+        return None
+
+
+def decode_bytes(data, flags=None):
+    import cv2
+    if not data:
+        return None
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR if flags is None else flags)
+
+
+def imread_bgr(path):
+    # cv2.imread, 同时支持视频帧与压缩包成员的虚拟路径
+    import cv2
+    container, member = split_virtual(path)
+    if member is not None and is_video(container):
+        return read_video_frame(container, int(member))
+    if archive_member(path):
+        return decode_bytes(read_archive_member(path))
+    return cv2.imread(path)
+
+
+def bgr_to_qimage(img):
+    img = np.ascontiguousarray(img)
+    image = QImage(img.data, img.shape[1], img.shape[0], img.strides[0], QImage.Format_BGR888)
+    # convertToFormat 产生拷贝, 不依赖 numpy 数组的生命周期
+    return image.convertToFormat(QImage.Format_RGB32)
+
+
+def read_image(path):
+    # QImage 可在工作线程中解码, QPixmap 只能在GUI线程使用
+    container, member = split_virtual(path)
+    if member is not None and is_video(container):
+        frame = read_video_frame(container, int(member))
+        return bgr_to_qimage(frame) if frame is not None else None
+    if archive_member(path):
+        image = QImage.fromData(read_archive_member(path) or b'')
+        return None if image.isNull() else image
+    image = QImage(path)
+    if image.isNull():
+        return None
+    return image
+
+
+def is_high_depth(path):
+    # PNG/TIFF 只读取文件头判断位深
+    ext = os.path.splitext(path)[1].lower()
+    if ext in HIGH_DEPTH_EXTENSIONS:
+        return True
+    if ext in ('.png', '.tif', '.tiff'):
+        return image_reader(path, 4096).imageFormat() in HIGH_DEPTH_FORMATS
+    return False
+
+
+def image_reader(path, header_size=-1):
+    # 压缩包成员只读取开头 header_size 字节交给 QImageReader 解析文件头
+    if not archive_member(path):
+        return QImageReader(path)
+    buffer = QBuffer()
+    buffer.setData(read_archive_member(path, header_size) or b'')
+    reader = QImageReader(buffer)
+    reader.buffer = buffer
+    return reader
+
+
+def read_high_depth(path):
+    # 返回保留原始位深的 (h, w) 或 (h, w, 3) RGB 数组, .npy 映射到内存而不读入
+    import cv2
+    packed = archive_member(path) is not None
+    if path.lower().endswith('.npy'):
+        try:
+            if packed:
+                array = np.load(io.BytesIO(read_archive_member(path) or b''))
+            else:
+                array = np.load(path, mmap_mode='r')
+        except (ValueError, OSError):
+            return None
+        return array if array.ndim == 2 else array[..., :3]
+    if packed:
+        img = decode_bytes(read_archive_member(path), cv2.IMREAD_UNCHANGED)
+    else:
+        img = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+    if img is None:
+        return None
+    if img.ndim == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_BGRA2RGB if img.shape[2] == 4 else cv2.COLOR_BGR2RGB)
+    return img
+
+
+def read_image_size(path):
+    # 只读取文件头
+    container, member = split_virtual(path)
+    if member is not None and is_video(container):
+        import cv2
+        capture = cv2.VideoCapture(container)
+        size = QSize(int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)), int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        capture.release()
+        return size
+    if archive_member(path):
+        # JPEG 的 SOF 可能位于较大的 EXIF 之后, 开头不够时再读整个成员
+        size = image_reader(path, 65536).size()
+        return size if size.isValid() else image_reader(path).size()
+    return QImageReader(path).size()
+
+
+def reduced_factor(full_size, width, height):
+    # 缩小解码后仍不小于显示尺寸的最大倍数
+    if not full_size.isValid() or width <= 0 or height <= 0:
+        return 1
+    scale = min(width / full_size.width(), height / full_size.height())
+    for factor in (8, 4, 2):
+        if scale * factor <= 1:
+            return factor
+    return 1
+
+
+def read_image_for_display(path, width, height):
+    # 以满足显示尺寸的最低分辨率解码, 返回 (image, 原图尺寸)
+    if not path.lower().endswith(JPEG_EXTENSIONS):
+        image = read_image(path)
+        return image, image.size() if image is not None else QSize()
+    if archive_member(path):
+        return read_member_for_display(path, width, height)
+    full_size = read_image_size(path)
+    factor = reduced_factor(full_size, width, height)
+    if factor > 1:
+        import cv2
+        img = cv2.imread(path, reduced_flags(factor))
+        if img is not None:
+            return bgr_to_qimage(img), full_size
+    image = read_image(path)
+    return image, image.size() if image is not None else full_size
+
+
+def read_member_for_display(path, width, height):
+    # 压缩包中的 JPEG: 成员只读取一次, 文件头与缩小解码共用同一份数据
+    data = read_archive_member(path)
+    if not data:
+        return None, QSize()
+    buffer = QBuffer()
+    buffer.setData(data)
+    full_size = QImageReader(buffer).size()
+    factor = reduced_factor(full_size, width, height)
+    if factor > 1:
+        img = decode_bytes(data, reduced_flags(factor))
+        if img is not None:
+            return bgr_to_qimage(img), full_size
+    image = QImage.fromData(data)
+    if image.isNull():
+        return None, full_size
+    return image, image.size()
+
+
+def as_rgb32(image):
+    # 32位格式在小端机器上按 B, G, R, A 存放, 可直接视为 numpy 数组
+    if image.format() in (QImage.Format_RGB32, QImage.Format_ARGB32):
+        return image
+    return image.convertToFormat(QImage.Format_RGB32)
+
+
+def array_qimage(array, fmt, owner=None):
+    # 零拷贝: QImage 直接引用 numpy 数组的内存, 数组 (或持有它的 owner) 挂在 QImage 上与其同生命周期
+    # 注意 C++ 侧的隐式共享拷贝不会持有 owner, 需要长期保存时应使用 copy()
+    height, width = array.shape[:2]
+    image = QImage(sip.voidptr(array.ctypes.data), width, height, array.strides[0], fmt)
+    image.owner = owner if owner is not None else array
+    return image
+
+
+def qimage_to_array(image):
+    # 零拷贝视图 (h, w, 4), 调用方需在使用期间持有 image
+    ptr = image.constBits()
+    ptr.setsize(image.sizeInBytes())
+    rows = np.frombuffer(ptr, np.uint8).reshape(image.height(), image.bytesPerLine())
+    return rows[:, :image.width() * 4].reshape(image.height(), image.width(), 4)
@@ -0,0 +1,112 @@
+from PyQt5.QtCore import *
+from PyQt5.QtGui import *
+import math
+import threading
+
+from src.tracing import tracer
+
+
+class ImagePyramid:
+    # 惰性构建的多分辨率金字塔, 第 k 层约为原图的 1/2^k
+    # 显示和放大镜选取仍满足输出尺寸的最小层, 大图的缩放/截取开销与原图尺寸基本无关
+    # 第 0 层可以是缩小解码的结果 (full_size 为原图尺寸), 坐标始终以原图为准
+    tiled = False  # 按块读取的超大图像 (TiledImage), 第 0 层只是概览
+    def __init__(self, image, full_size=None, min_size=32):
+        self.levels = [image]
+        self.full_size = QSize(full_size) if full_size is not None else image.size()
+        self.full_requested = False  # 放大镜已请求原图
+        self.full_lock = threading.Lock()
+        self.min_size = min_size
+        self.on_resize = None  # 层数变化时回调 (字节增量), 由 ImageCache 设置
+        self._lock = threading.Lock()
+
+    def width(self):
+        return self.full_size.width()
+
+    def height(self):
+        return self.full_size.height()
+
+    def size(self):
+        return QSize(self.full_size)
+
+    def base_scale(self):
+        return self.levels[0].width() / self.full_size.width()
+
+    def is_reduced(self):
+        return self.levels[0].width() < self.full_size.width()
+
+    def covers(self, scale):
+        # 第 0 层的分辨率是否足以按 scale 输出
+        return scale <= self.base_scale() * 1.001
+
+    def nbytes(self):
+        return sum(level.sizeInBytes() for level in self.levels)
+
+    def max_level(self):
+        min_side = min(self.levels[0].width(), self.levels[0].height())
+        if min_side <= self.min_size:
+            return 0
+        return int(math.log2(min_side / self.min_size))
+
+    def level(self, k):
+        k = max(0, min(k, self.max_level()))
+        grown = 0
+        with self._lock:
+            while len(self.levels) <= k:
+                prev = self.levels[-1]
+                with tracer.span('scale.level', level=len(self.levels)):
+                    level = prev.scaled(max(1, prev.width() // 2), max(1, prev.height() // 2),
+                                        Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+                self.levels.append(level)
+                grown += level.sizeInBytes()
+            level = self.levels[k]
+        # 在锁外回调, 避免与缓存的锁形成环
+        if grown and self.on_resize is not None:
+            self.on_resize(self, grown)
+        return level
+
+    def level_for_scale(self, scale):
+        # scale = 输出尺寸 / 原图尺寸, 返回分辨率仍不低于输出的最小层号
+        scale = scale / self.base_scale()
+        if scale <= 0 or scale >= 1:
+            return 0
+        return min(int(math.floor(math.log2(1 / scale))), self.max_level())
+
+    def scaled(self, width, height, transform=Qt.SmoothTransformation):
+        scale = min(width / self.width(), height / self.height())
+        level = self.level(self.level_for_scale(scale))
+        with tracer.span('scale'):
+            display = level.scaled(width, height, Qt.KeepAspectRatio, transform)
+        # 尺寸不变时 Qt 返回共享数据的浅拷贝, 零拷贝包装的层需要独立的一份才能跨线程传递
+        if display.size() == level.size() and hasattr(level, 'owner'):
+            display = level.copy()
+        return display
+
+    def draw_region(self, painter, target, source):
+        # source 为原图坐标系下的矩形, 从满足 target 尺寸的最小层截取
+        scale = min(target.width() / max(source.width(), 1), target.height() / max(source.height(), 1))
+        level = self.level(self.level_for_scale(scale))
+        fx = level.width() / self.width()
+        fy = level.height() / self.height()
+        painter.drawImage(target, level, QRectF(source.x() * fx, source.y() * fy,
+                                                source.width() * fx, source.height() * fy))
+
+    def upgrade(self, image):
+        # 用原图替换缩小解码的结果, 已构建的层一并丢弃
+        with self._lock:
+            delta = image.sizeInBytes() - sum(level.sizeInBytes() for level in self.levels)
+            self.levels = [image]
+            self.full_size = image.size()
+        if self.on_resize is not None:
+            self.on_resize(self, delta)
+
+    def apply_window(self):
+        # 窗宽窗位变化后重新映射, 返回显示是否改变; 8位图像不受影响
+        return False
+
+    def evict_levels(self):
+        # 内存紧张时丢弃除原图外的所有层, 需要时会重新构建
+        with self._lock:
+            freed = sum(level.sizeInBytes() for level in self.levels[1:])
+            del self.levels[1:]
+        return freed
@@ -0,0 +1,172 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+import multiprocessing
+import threading
+import weakref
+import os
+
+
+class MemoryEntry:
+    __slots__ = ('ref', 'nbytes', 'release', 'trim', 'pins')
+
+    def __init__(self, ref, nbytes, release, trim):
+        self.ref = ref
+        self.nbytes = nbytes
+        self.release = release  # 无参回调, 被淘汰时调用 (不能持有对象本身的强引用)
+        self.trim = trim  # trim(obj) -> 释放的字节数, 内存紧张时先于 release 调用
+        self.pins = 0
+
+
+class MemoryManager:
+    # 统一记录程序持有的所有图像缓冲, 超出预算时按LRU先裁剪再淘汰
+    # 被淘汰的缓存在下次访问时重新加载, 面板正在显示的对象被 pin 住不会淘汰
+    def __init__(self, budget_bytes=2048 * 1024 * 1024):
+        self.budget_bytes = budget_bytes
+        self.used_bytes = 0
+        self.peak_bytes = 0
+        self._entries = OrderedDict()  # id(obj) -> MemoryEntry
+        self._lock = threading.RLock()
+
+    def register(self, obj, nbytes=None, release=None, trim=None):
+        if nbytes is None:
+            nbytes = obj.nbytes()
+        key = id(obj)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = MemoryEntry(weakref.ref(obj), 0, release, trim)
+                self._entries[key] = entry
+                # 对象被回收时自动移除记录
+                weakref.finalize(obj, self._forget, key, entry)
+            else:
+                entry.release = release or entry.release
+                entry.trim = trim or entry.trim
+                self._entries.move_to_end(key)
+            self._add(entry, nbytes - entry.nbytes)
+        self.enforce()
+
+    def adjust(self, obj, delta):
+        with self._lock:
+            entry = self._entries.get(id(obj))
+            if entry is None:
+                return
+            self._add(entry, delta)
+        if delta > 0:
+            self.enforce()
+
+    def touch(self, obj):
+        with self._lock:
+            if id(obj) in self._entries:
+                self._entries.move_to_end(id(obj))
+
+    def unregister(self, obj):
+        with self._lock:
+            entry = self._entries.pop(id(obj), None)
+            if entry is not None:
+                self.used_bytes -= entry.nbytes
+
+    def pin(self, obj):
+        if obj is None:
+            return
+        with self._lock:
+            entry = self._entries.get(id(obj))
+            if entry is not None:
+                entry.pins += 1
+                self._entries.move_to_end(id(obj))
+                return
+        self.register(obj)
+        with self._lock:
+            entry = self._entries.get(id(obj))
+            if entry is not None:
+                entry.pins += 1
+
+    def unpin(self, obj):
+        if obj is None:
+            return
+        with self._lock:
+            entry = self._entries.get(id(obj))
+            if entry is not None and entry.pins > 0:
+                entry.pins -= 1
+
+    @contextmanager
+    def transient(self, nbytes):
+        # 临时计算缓冲 (如差异图的中间数组), 计算期间计入用量并为其腾出空间
+        token = _Transient()
+        self.register(token, nbytes)
+        self.pin(token)
+        try:
+            yield
+        finally:
+            self.unregister(token)
+
+    def set_budget(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self.enforce()
+
+    def enforce(self):
+        # 在锁外调用回调, 回调中可能再次访问管理器或其他对象的锁
+        with self._lock:
+            if self.used_bytes <= self.budget_bytes:
+                return
+            candidates = [(entry.ref(), entry) for entry in self._entries.values()]
+
+        # 第一轮: 裁剪 (如丢弃金字塔层), 最久未使用的优先
+        for obj, entry in candidates:
+            if self.used_bytes <= self.budget_bytes:
+                return
+            if obj is not None and entry.trim is not None:
+                freed = entry.trim(obj)
+                with self._lock:
+                    if self._entries.get(id(obj)) is entry:
+                        self._add(entry, -min(freed, entry.nbytes))
+
+        # 第二轮: 淘汰未被 pin 的对象, 最新的一个除外
+        for obj, entry in candidates[:-1]:
+            if self.used_bytes <= self.budget_bytes:
+                return
+            if obj is None or entry.pins or entry.release is None:
+                continue
+            with self._lock:
+                if self._entries.pop(id(obj), None) is None:
+                    continue
+                self.used_bytes -= entry.nbytes
+            entry.release()
+
+    def _add(self, entry, delta):
+        entry.nbytes += delta
+        self.used_bytes += delta
+        self.peak_bytes = max(self.peak_bytes, self.used_bytes)
+
+    def _forget(self, key, entry):
+        with self._lock:
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+                self.used_bytes -= entry.nbytes
+
+
+class _Transient:
+    pass
+
+
+def private_bytes(pid):
+    # 常驻内存减去共享的文件页 (各进程共用的动态库), 即多一个进程实际增加的内存
+    # 只读取 /proc, 其他平台返回 0
+    try:
+        with open(f'/proc/{pid}/statm') as f:
+            fields = f.read().split()
+        return (int(fields[1]) - int(fields[2])) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return 0
+
+
+class ProcessFootprint:
+    # 子进程 (解码进程池, 指标/扫描进程池) 的内存不属于任何缓存, 作为不可淘汰的一项计入预算,
+    # 超出预算时由图像缓存让出空间
+    def __init__(self, memory_manager):
+        self.memory_manager = memory_manager
+        self.used_bytes = 0
+
+    def update(self):
+        self.used_bytes = sum(private_bytes(process.pid) for process in multiprocessing.active_children())
+        self.memory_manager.register(self, self.used_bytes)
+        return self.used_bytes
@@ -0,0 +1,151 @@
+import numpy as np
+import hashlib
+import json
+import math
+import threading
+import os
+import cv2
+
+from src.image_io import imread_bgr, split_virtual
+from src.process_pool import map_in_processes
+
+METRICS = ('psnr', 'ssim')
+SIDECAR_NAME = '.multi_viewer_metrics.json'
+
+# SSIM 的标准参数: 11x11 高斯窗口, sigma = 1.5
+SSIM_C1 = (0.01 * 255) ** 2
+SSIM_C2 = (0.03 * 255) ** 2
+
+
+def psnr(gt, img):
+    diff = cv2.absdiff(gt, img).astype(np.float32)
+    mse = float(np.mean(diff * diff))
+    if mse == 0:
+        return math.inf
+    return 10 * math.log10(255.0 ** 2 / mse)
+
+
+def ssim(gt, img):
+    # 在灰度图上计算, 均值与方差均由高斯滤波得到
+    if gt.ndim == 3:
+        gt = cv2.cvtColor(gt, cv2.COLOR_BGR2GRAY)
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    x = gt.astype(np.float32)
+    y = img.astype(np.float32)
+    blur = lambda a: cv2.GaussianBlur(a, (11, 11), 1.5)
+    mu_x, mu_y = blur(x), blur(y)
+    mu_xx, mu_yy, mu_xy = mu_x * mu_x, mu_y * mu_y, mu_x * mu_y
+    sigma_x = blur(x * x) - mu_xx
+    sigma_y = blur(y * y) - mu_yy
+    sigma_xy = blur(x * y) - mu_xy
+    ssim_map = ((2 * mu_xy + SSIM_C1) * (2 * sigma_xy + SSIM_C2)) / \
+               ((mu_xx + mu_yy + SSIM_C1) * (sigma_x + sigma_y + SSIM_C2))
+    return float(ssim_map.mean())
+
+
+def score_task(task):
+    # 进程池任务: 一行图像, 真值只读取一次
+    row, gt_path, gt_mtime, paths = task
+    gt = imread_bgr(gt_path)
+    scores = {}
+    if gt is None:
+        return scores
+    for folder, path, filename, mtime in paths:
+        img = imread_bgr(path)
+        if img is None or img.shape != gt.shape:
+            continue
+        scores[folder] = (psnr(gt, img), ssim(gt, img))
+    return scores
+
+
+def file_mtime(path):
+    # 视频帧与压缩包成员使用容器文件的 mtime
+    try:
+        return os.stat(split_virtual(path)[0]).st_mtime_ns
+    except OSError:
+        return None
+
+
+class MetricsStore:
+    # 每个方法文件夹旁的 sidecar 文件, 以 (文件 mtime, 真值 mtime) 判断是否需要重新计算
+    # 文件夹不可写时存放在 fallback_dir 中
+    def __init__(self, directory, fallback_dir=None):
+        self.directory = directory
+        self.path = os.path.join(directory, SIDECAR_NAME)
+        # 视频和压缩包旁不能放 sidecar 目录, 同样存放在 fallback_dir 中
+        if not (os.path.isdir(directory) and os.access(directory, os.W_OK)) and fallback_dir is not None:
+            digest = hashlib.sha1(os.path.abspath(directory).encode('utf-8')).hexdigest()
+            self.path = os.path.join(fallback_dir, 'metrics', digest + '.json')
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.records = json.load(f)
+        except (OSError, ValueError):
+            self.records = {}
+        self.dirty = False
+
+    def get(self, filename, mtime, gt_path, gt_mtime):
+        record = self.records.get(filename)
+        if record and record['mtime'] == mtime and record['gt'] == gt_path and record['gt_mtime'] == gt_mtime:
+            return record['psnr'], record['ssim']
+        return None
+
+    def put(self, filename, mtime, gt_path, gt_mtime, scores):
+        self.records[filename] = {'mtime': mtime, 'gt': gt_path, 'gt_mtime': gt_mtime,
+                                  'psnr': scores[0], 'ssim': scores[1]}
+        self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        # 被取消的运行可能与新的运行同时保存同一个 sidecar, 临时文件按线程区分
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.records, f)
+            os.replace(tmp_path, self.path)
+            self.dirty = False
+        except OSError:
+            pass
+
+
+def compute_dataset_metrics(dataset_index, fallback_dir=None, workers=None, progress=None, cancelled=None):
+    # 计算所有文件夹相对于文件夹1 (真值) 的 PSNR/SSIM
+    # 返回 {'psnr': (行数, 文件夹数) 数组, 'ssim': ...}, 缺失处为 nan
+    rows = len(dataset_index)
+    folders = len(dataset_index.entries)
+    results = {name: np.full((rows, folders), np.nan, np.float64) for name in METRICS}
+    stores = {i: MetricsStore(dataset_index.directories[i], fallback_dir)
+              for i in range(1, folders) if dataset_index.has_folder(i)}
+
+    tasks = []
+    for row in range(rows):
+        gt_path = dataset_index.path(row, 0)
+        if gt_path is None:
+            continue
+        gt_mtime = file_mtime(gt_path)
+        pending = []
+        for i, store in stores.items():
+            path = dataset_index.path(row, i)
+            if path is None:
+                continue
+            filename, mtime = dataset_index.filename(row, i), file_mtime(path)
+            cached = store.get(filename, mtime, gt_path, gt_mtime)
+            if cached is not None:
+                results['psnr'][row, i], results['ssim'][row, i] = cached
+            else:
+                pending.append((i, path, filename, mtime))
+        if pending:
+            # 写回缓存所需的文件名与 mtime 随任务保存, 计算期间索引可能被GUI线程修改
+            tasks.append((row, gt_path, gt_mtime, pending))
+
+    for (row, gt_path, gt_mtime, pending), scores in map_in_processes(score_task, tasks, workers,
+                                                                      progress, cancelled):
+        for i, path, filename, mtime in pending:
+            if i in scores:
+                results['psnr'][row, i], results['ssim'][row, i] = scores[i]
+                stores[i].put(filename, mtime, gt_path, gt_mtime, scores[i])
+
+    for store in stores.values():
+        store.save()
+    return results
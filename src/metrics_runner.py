@@ -0,0 +1,62 @@
+from PyQt5.QtCore import *
+import threading
+
+
+class BackgroundRunner(QObject):
+    # 在后台线程中驱动进程池计算, 通过信号把进度和结果送回GUI线程
+    # 每次运行有自己的取消标志: 取消后的线程仍要等进程池中正在执行的任务结束, 新的运行不必等它
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(object)
+    _done = pyqtSignal(object, object)
+
+    def __init__(self, fallback_dir=None, workers=None, parent=None):
+        super().__init__(parent)
+        self.fallback_dir = fallback_dir
+        self.workers = workers
+        self._thread = None
+        self._cancel = threading.Event()
+        self._done.connect(self._deliver)
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive() and not self._cancel.is_set()
+
+    def start(self, *args):
+        if self.is_running():
+            return False
+        self._cancel = cancel = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(cancel,) + args, daemon=True)
+        self._thread.start()
+        return True
+
+    def cancel(self):
+        self._cancel.set()
+
+    def _run(self, cancel, *args):
+        def report(done, total):
+            if not cancel.is_set():
+                self.progress.emit(done, total)
+        results = self.compute(report, cancel.is_set, *args)
+        self._done.emit(cancel, results)
+
+    def _deliver(self, cancel, results):
+        # 在GUI线程中判断, 取消与结果到达之间没有竞争
+        if not cancel.is_set():
+            self.finished.emit(results)
+
+    def compute(self, progress, cancelled, *args):
+        raise NotImplementedError
+
+
+class MetricsRunner(BackgroundRunner):
+    def compute(self, progress, cancelled, dataset_index):
+        # 计算模块依赖 OpenCV, 第一次计算时才导入
+        from src.metrics import compute_dataset_metrics
+        return compute_dataset_metrics(dataset_index, self.fallback_dir, self.workers,
+                                       progress=progress, cancelled=cancelled)
+
+
+class RegionScanRunner(BackgroundRunner):
+    def compute(self, progress, cancelled, dataset_index, rect_size, label_size, top_k):
+        from src.region_scanner import scan_dataset
+        return scan_dataset(dataset_index, rect_size, label_size, top_k, self.workers,
+                            progress=progress, cancelled=cancelled)
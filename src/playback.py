@@ -0,0 +1,248 @@
+from PyQt5.QtCore import *
+from collections import deque
+import threading
+import time
+
+from src.image_io import bgr_to_qimage, read_image_for_display
+from src.image_pyramid import ImagePyramid
+
+
+class FrameRing:
+    # 有界缓冲, 解码线程写满后阻塞等待, GUI线程按帧号取出
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.frames = deque()
+        self.closed = False
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        with self._cond:
+            return len(self.frames)
+
+    def put(self, item):
+        with self._cond:
+            while len(self.frames) >= self.capacity and not self.closed:
+                self._cond.wait()
+            if self.closed:
+                return False
+            self.frames.append(item)
+            return True
+
+    def head(self):
+        # 最早的帧号, 缓冲为空时为 None
+        with self._cond:
+            return self.frames[0][0] if self.frames else None
+
+    def frame_numbers(self):
+        with self._cond:
+            return [item[0] for item in self.frames]
+
+    def pop_before(self, frame):
+        # 丢弃帧号小于 frame 的帧, 返回丢弃的数量
+        with self._cond:
+            count = 0
+            while self.frames and self.frames[0][0] < frame:
+                self.frames.popleft()
+                count += 1
+            if count:
+                self._cond.notify_all()
+            return count
+
+    def pop(self):
+        with self._cond:
+            item = self.frames.popleft()
+            self._cond.notify_all()
+            return item
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self.frames.clear()
+            self._cond.notify_all()
+
+
+class ImageSequence:
+    # 图像文件夹按列表顺序组成的序列, paths 中缺失的帧为 None
+    def __init__(self, paths):
+        self.paths = paths
+
+    def frames(self, start, width, height, min_frame):
+        k = start
+        while k < len(self.paths):
+            # 解码跟不上播放时直接跳到当前需要的帧
+            k = max(k, min_frame())
+            if k >= len(self.paths):
+                return
+            path = self.paths[k]
+            if path is None:
+                yield k, None
+            else:
+                image, full_size = read_image_for_display(path, width, height)
+                yield k, ImagePyramid(image, full_size) if image is not None else None
+            k += 1
+
+
+class VideoSequence:
+    # 视频文件顺序解码, 只在开始时定位一次
+    def __init__(self, path):
+        self.path = path
+
+    def frames(self, start, width, height, min_frame):
+        import cv2
+        capture = cv2.VideoCapture(self.path)
+        try:
+            if start:
+                capture.set(cv2.CAP_PROP_POS_FRAMES, start)
+            k = start
+            while True:
+                # 已过期的帧只 grab 不转换
+                while k < min_frame():
+                    if not capture.grab():
+                        return
+                    k += 1
+                ok, frame = capture.read()
+                if not ok:
+                    return
+                yield k, ImagePyramid(bgr_to_qimage(frame))
+                k += 1
+        finally:
+            capture.release()
+
+
+class DecodeThread(threading.Thread):
+    # 每个文件夹一个解码线程, 解码并缩放到显示尺寸后写入 FrameRing
+    def __init__(self, sequence, ring, start, width, height, min_frame):
+        super().__init__(daemon=True)
+        self.sequence = sequence
+        self.ring = ring
+        self.start_frame = start
+        self.width = width
+        self.height = height
+        self.min_frame = min_frame
+
+    def run(self):
+        frames = self.sequence.frames(self.start_frame, self.width, self.height, self.min_frame)
+        for k, image in frames:
+            display = image.scaled(self.width, self.height) if image is not None else None
+            if not self.ring.put((k, image, display)):
+                return
+
+
+class PlaybackController(QObject):
+    # 按目标帧率同步播放所有文件夹: 显示所有文件夹都已解码的最新一帧
+    # 播放时间按墙上时钟推进, 来不及解码的帧被跳过并计入丢帧
+    frame_ready = pyqtSignal(int, object)  # frame, {panel: (ImagePyramid, display)}
+    stats_changed = pyqtSignal(object)
+    finished = pyqtSignal()
+
+    def __init__(self, fps=25, buffer_size=8, parent=None):
+        super().__init__(parent)
+        self.fps = fps
+        self.buffer_size = buffer_size
+        self.rings = {}
+        self.threads = []
+        self.start_time = None
+        self.target_frame = 0
+        self.timer = QTimer(self)
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.timeout.connect(self.tick)
+
+    def is_running(self):
+        return self.timer.isActive()
+
+    def start(self, sequences, frame_count, start_frame, width, height):
+        # sequences: {panel: ImageSequence/VideoSequence}
+        self.stop()
+        self.frame_count = frame_count
+        self.start_frame = start_frame
+        self.last_frame = start_frame - 1
+        self.presented = 0
+        self.dropped = 0
+        self.stalls = 0
+        self.latency_total = 0.0
+        self.window = deque()
+        self.target_frame = start_frame
+        self.rings = {panel: FrameRing(self.buffer_size) for panel in sequences}
+        self.threads = [DecodeThread(sequence, self.rings[panel], start_frame, width, height,
+                                     lambda: self.target_frame)
+                        for panel, sequence in sequences.items()]
+        for thread in self.threads:
+            thread.start()
+        self.start_time = None
+        self.stats_time = time.perf_counter()
+        # 以半个帧间隔检查, 显示延迟不超过半帧
+        self.timer.start(max(1, int(500 / self.fps)))
+
+    def stop(self):
+        self.timer.stop()
+        for ring in self.rings.values():
+            ring.close()
+        for thread in self.threads:
+            thread.join()
+        self.rings = {}
+        self.threads = []
+
+    def set_fps(self, fps):
+        # 从当前帧开始按新的帧率计时
+        if self.start_time is not None:
+            self.start_frame = self.last_frame + 1
+            self.start_time = time.perf_counter()
+        self.fps = fps
+        if self.timer.isActive():
+            self.timer.setInterval(max(1, int(500 / fps)))
+
+    def tick(self):
+        now = time.perf_counter()
+        if self.start_time is None:
+            # 等第一帧全部就绪后才开始计时, 避免启动时的解码延迟全部算作丢帧
+            if not all(ring.head() is not None for ring in self.rings.values()):
+                return
+            self.start_time = now
+        target = self.start_frame + int((now - self.start_time) * self.fps)
+        if target >= self.frame_count:
+            self.stop()
+            self.finished.emit()
+            return
+        if target <= self.last_frame:
+            return
+        self.target_frame = target
+
+        # 某个文件夹已越过的帧在其他文件夹中也不可能再显示, 先丢弃以腾出缓冲
+        heads = [ring.head() for ring in self.rings.values()]
+        if all(head is not None for head in heads):
+            for ring in self.rings.values():
+                ring.pop_before(max(heads))
+        # 所有文件夹都已解码且不晚于 target 的最新一帧
+        common = None
+        for ring in self.rings.values():
+            numbers = {k for k in ring.frame_numbers() if k <= target}
+            common = numbers if common is None else common & numbers
+        frame = max(common) if common else None
+        if frame is None or frame <= self.last_frame:
+            self.stalls += 1
+            return
+
+        results = {}
+        for panel, ring in self.rings.items():
+            ring.pop_before(frame)
+            _, image, display = ring.pop()
+            results[panel] = (image, display)
+        self.dropped += frame - self.last_frame - 1
+        self.last_frame = frame
+        self.presented += 1
+        # 延迟: 实际显示时间与该帧计划显示时间之差
+        self.latency_total += now - (self.start_time + (frame - self.start_frame) / self.fps)
+        self.window.append(now)
+        self.frame_ready.emit(frame, results)
+
+        if now - self.stats_time >= 0.5:
+            while self.window and now - self.window[0] > 1.0:
+                self.window.popleft()
+            self.stats_time = now
+            self.stats_changed.emit({
+                'fps': len(self.window),
+                'dropped': self.dropped,
+                'stalls': self.stalls,
+                'latency_ms': 1000 * self.latency_total / max(self.presented, 1),
+                'buffered': min(len(ring) for ring in self.rings.values()),
+            })
@@ -0,0 +1,145 @@
+from PyQt5.QtCore import *
+import threading
+
+from src.image_io import is_high_depth, read_high_depth, read_image, read_image_for_display
+from src.image_pyramid import ImagePyramid
+from src.tiled_image import TiledImage, open_tiled_source
+from src.window_level import HdrImage
+from src.tracing import tracer
+
+
+class DecodeTask(QRunnable):
+    def __init__(self, prefetcher, path, width=None, height=None):
+        super().__init__()
+        self.prefetcher = prefetcher
+        self.path = path
+        self.width = width
+        self.height = height
+
+    def run(self):
+        self.prefetcher.load(self.path, self.width, self.height)
+
+
+class ImagePrefetcher:
+    # 在线程池中预解码列表中相邻的图像, 结果放入共享的 ImageCache
+    def __init__(self, cache, radius=3, max_threads=None, disk_cache=None, tile_cache=None, decoder=None,
+                 window=None):
+        self.cache = cache
+        self.window = window  # 16位/浮点图像共享的 WindowLevel
+        self.decoder = decoder  # ShmDecoder, 在进程池中解码, 为 None 时在线程中解码
+        self.disk_cache = disk_cache
+        self.tile_cache = tile_cache
+        self.radius = radius
+        self.pool = QThreadPool()
+        if max_threads is None:
+            max_threads = max(2, QThread.idealThreadCount() - 1)
+        self.pool.setMaxThreadCount(max_threads)
+
+        self._lock = threading.Lock()
+        self._queued = set()
+        self._inflight = {}  # path -> threading.Event, 正在解码的图像
+
+    def decode(self, path, width=None, height=None):
+        # 给定显示尺寸时按最低满足的分辨率解码, 否则解码原图
+        # 超大图像只读取概览, 放大时再按块读取
+        if self.tile_cache is not None:
+            source = open_tiled_source(path, self.window)
+            if source is not None:
+                return TiledImage(path, source, self.tile_cache)
+        # 高位深图像保留原始数据, 调整窗口时不必重新解码
+        if self.window is not None and is_high_depth(path):
+            array = read_high_depth(path)
+            if array is not None:
+                return HdrImage(array, self.window)
+        if self.decoder is not None:
+            image = self.decoder.decode(path, width, height)
+            if image is not None:
+                return image
+        if width is None:
+            image = read_image(path)
+            return ImagePyramid(image) if image is not None else None
+        image, full_size = read_image_for_display(path, width, height)
+        return ImagePyramid(image, full_size) if image is not None else None
+
+    def load(self, path, width=None, height=None):
+        # 同步获取图像金字塔: 命中缓存直接返回, 正在被后台解码则等待其完成
+        # width 为空表示需要原图分辨率 (差异图, 放大镜等)
+        image = self.cache.get(path)
+        if image is None:
+            image = self._load_uncached(path, width, height)
+        if image is None:
+            return None
+        # 缓存中的图像可能是按旧窗口映射的
+        image.apply_window()
+        if width is None:
+            self.ensure_full(path, image)
+        elif not image.covers(min(width / image.width(), height / image.height())):
+            # 显示尺寸变大, 缩小解码的结果已不够用
+            self.ensure_full(path, image)
+        return image
+
+    def ensure_full(self, path, image):
+        with image.full_lock:
+            if image.is_reduced():
+                with tracer.span('decode.full', path=path):
+                    full = self.decoder.decode(path) if self.decoder is not None else None
+                    full = full.level(0) if full is not None else read_image(path)
+                if full is not None:
+                    image.upgrade(full)
+        return image
+
+    def _load_uncached(self, path, width, height):
+        with self._lock:
+            self._queued.discard(path)
+            event = self._inflight.get(path)
+            if event is None:
+                event = threading.Event()
+                self._inflight[path] = event
+                owner = True
+            else:
+                owner = False
+
+        if not owner:
+            event.wait()
+            image = self.cache.get(path)
+            if image is not None:
+                return image
+            with tracer.span('decode', path=path):
+                return self.decode(path, width, height)
+
+        try:
+            with tracer.span('decode', path=path):
+                image = self.decode(path, width, height)
+            self.cache.put(path, image)
+            # 顺便生成缩略图, 下次打开同一数据集时可先显示
+            if image is not None and self.disk_cache is not None:
+                self.disk_cache.save_thumbnail(path, image)
+        finally:
+            with self._lock:
+                self._inflight.pop(path, None)
+            event.set()
+        return image
+
+    def prefetch(self, paths, width=None, height=None):
+        # paths 按优先级排列, 新的预取请求会丢弃尚未开始的旧任务
+        self.pool.clear()
+        with self._lock:
+            self._queued.clear()
+            for path in paths:
+                if path in self._queued or path in self._inflight or path in self.cache:
+                    continue
+                self._queued.add(path)
+                self.pool.start(DecodeTask(self, path, width, height))
+
+    def neighbour_rows(self, index, count):
+        # 先下一张再上一张, 由近及远
+        rows = []
+        for d in range(1, self.radius + 1):
+            for row in (index + d, index - d):
+                if 0 <= row < count:
+                    rows.append(row)
+        return rows
+
+    def shutdown(self):
+        self.pool.clear()
+        self.pool.waitForDone()
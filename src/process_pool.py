@@ -0,0 +1,21 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+
+
+def map_in_processes(function, tasks, workers=None, progress=None, cancelled=None):
+    # 按任务顺序产出 (task, result), 每完成一个任务报告一次进度, 取消后丢弃尚未开始的任务
+    # 多线程的GUI进程中 fork 不安全, 使用 spawn 启动工作进程
+    if not tasks:
+        return
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        chunksize = max(1, len(tasks) // ((workers or os.cpu_count() or 1) * 16))
+        results = executor.map(function, tasks, chunksize=chunksize)
+        for done, (task, result) in enumerate(zip(tasks, results), 1):
+            yield task, result
+            if progress is not None:
+                progress(done, len(tasks))
+            if cancelled is not None and cancelled():
+                executor.shutdown(wait=False, cancel_futures=True)
+                break
@@ -0,0 +1,81 @@
+import numpy as np
+import heapq
+import cv2
+
+from src.image_io import imread_bgr
+from src.process_pool import map_in_processes
+
+
+def display_scale(width, height, label_width, label_height):
+    # 与面板显示一致 (KeepAspectRatio): 原图像素 / 显示像素
+    return max(width / label_width, height / label_height)
+
+
+def worst_boxes(error, box_width, box_height, top_k):
+    # error: 逐像素误差图 (float32), 用 boxFilter 一次得到所有位置的框内均值
+    # 只保留完整落在图像内的框, 选出 top_k 个互不重叠的最大值
+    height, width = error.shape
+    box_width = max(1, min(box_width, width))
+    box_height = max(1, min(box_height, height))
+    means = cv2.boxFilter(error, -1, (box_width, box_height), normalize=True,
+                          borderType=cv2.BORDER_CONSTANT)
+    # boxFilter 的锚点在框中心, 截取框完整时的中心范围
+    x0, y0 = box_width // 2, box_height // 2
+    valid = means[y0:y0 + height - box_height + 1, x0:x0 + width - box_width + 1]
+
+    results = []
+    for _ in range(top_k):
+        idx = int(np.argmax(valid))
+        cy, cx = divmod(idx, valid.shape[1])
+        score = float(valid[cy, cx])
+        if not np.isfinite(score) or score < 0:
+            break
+        results.append((score, cx + x0, cy + y0))
+        # 抑制与已选框重叠的位置
+        valid[max(0, cy - box_height + 1):cy + box_height, max(0, cx - box_width + 1):cx + box_width] = -1
+    return results
+
+
+def scan_task(task):
+    # 进程池任务: 一行图像, 返回 [(mse, row, folder, cx, cy)], 坐标为原图像素
+    row, gt_path, paths, rect_width, rect_height, label_width, label_height, top_k = task
+    gt = imread_bgr(gt_path)
+    if gt is None:
+        return []
+    gt = gt.astype(np.float32)
+    scale = display_scale(gt.shape[1], gt.shape[0], label_width, label_height)
+    box_width = int(rect_width * scale)
+    box_height = int(rect_height * scale)
+    results = []
+    for folder, path in paths:
+        img = imread_bgr(path)
+        if img is None or img.shape != gt.shape:
+            continue
+        diff = cv2.subtract(img.astype(np.float32), gt)
+        error = cv2.transform(diff * diff, np.full((1, 3), 1 / 3, np.float32))
+        for score, cx, cy in worst_boxes(error, box_width, box_height, top_k):
+            results.append((score, row, folder, cx, cy))
+    return results
+
+
+def scan_dataset(dataset_index, rect_size, label_size, top_k=50, workers=None, progress=None, cancelled=None):
+    # 以当前放大框大小扫描所有文件夹 (相对于文件夹1), 返回误差最大的 top_k 个框
+    # rect_size / label_size 为面板坐标, 在每张图像上按显示比例换算为原图像素
+    tasks = []
+    for row in range(len(dataset_index)):
+        gt_path = dataset_index.path(row, 0)
+        if gt_path is None:
+            continue
+        paths = [(i, dataset_index.path(row, i)) for i in range(1, len(dataset_index.entries))
+                 if dataset_index.path(row, i) is not None]
+        if paths:
+            tasks.append((row, gt_path, paths) + tuple(rect_size) + tuple(label_size) + (top_k,))
+
+    heap = []
+    for _, results in map_in_processes(scan_task, tasks, workers, progress, cancelled):
+        for item in results:
+            if len(heap) < top_k:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+    return sorted(heap, reverse=True)
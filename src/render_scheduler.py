@@ -0,0 +1,49 @@
+from PyQt5.QtCore import *
+from PyQt5.QtGui import *
+from collections import OrderedDict, deque
+import time
+
+
+class RenderScheduler(QObject):
+    # 将鼠标事件合并为每个显示帧每个面板至多一次截取和一次 update()
+    fps_changed = pyqtSignal(float)
+
+    def __init__(self, refresh_rate=None, parent=None):
+        super().__init__(parent)
+        if refresh_rate is None:
+            screen = QGuiApplication.primaryScreen()
+            refresh_rate = screen.refreshRate() if screen else 60
+        self.frame_interval = 1000.0 / max(refresh_rate or 60, 1)
+
+        self._dirty = OrderedDict()
+        self._last_frame = 0.0
+        self._frame_times = deque()
+        self._last_report = 0.0
+        self.fps = 0.0
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.timeout.connect(self.render_frame)
+
+    def request(self, draw_label):
+        self._dirty[draw_label] = None
+        if not self.timer.isActive():
+            elapsed = (time.perf_counter() - self._last_frame) * 1000
+            self.timer.start(int(max(0, self.frame_interval - elapsed)))
+
+    def render_frame(self):
+        now = time.perf_counter()
+        self._last_frame = now
+        dirty, self._dirty = self._dirty, OrderedDict()
+        for draw_label in dirty:
+            draw_label.render_frame()
+
+        # 统计最近一秒实际渲染的帧数
+        self._frame_times.append(now)
+        while self._frame_times and now - self._frame_times[0] > 1.0:
+            self._frame_times.popleft()
+        if now - self._last_report > 0.5:
+            self._last_report = now
+            self.fps = float(len(self._frame_times))
+            self.fps_changed.emit(self.fps)
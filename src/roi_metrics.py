@@ -0,0 +1,113 @@
+from collections import OrderedDict
+from functools import partial
+import numpy as np
+import threading
+import math
+
+from src.image_io import as_rgb32, qimage_to_array
+from src.tracing import tracer
+
+
+class ErrorTables:
+    # 误差的积分图 (summed-area table), 任意矩形内的误差和只需查4个角点
+    # abs_sum / sq_sum 形状为 (h+1, w+1), 第0行第0列为0, 使用 float64 避免大图上的精度损失
+    def __init__(self, abs_sum, sq_sum, channels=3):
+        self.abs_sum = abs_sum
+        self.sq_sum = sq_sum
+        self.channels = channels
+
+    def width(self):
+        return self.abs_sum.shape[1] - 1
+
+    def height(self):
+        return self.abs_sum.shape[0] - 1
+
+    def nbytes(self):
+        return self.abs_sum.nbytes + self.sq_sum.nbytes
+
+    def box_sum(self, table, x0, y0, x1, y1):
+        return table[y1, x1] - table[y0, x1] - table[y1, x0] + table[y0, x0]
+
+    def box(self, x, y, width, height):
+        # 原图坐标系下的矩形, 返回 (mse, mae, psnr), 矩形与图像不相交时返回 None
+        x0 = min(max(int(x), 0), self.width())
+        y0 = min(max(int(y), 0), self.height())
+        x1 = min(max(int(x + width), 0), self.width())
+        y1 = min(max(int(y + height), 0), self.height())
+        count = (x1 - x0) * (y1 - y0) * self.channels
+        if count <= 0:
+            return None
+        mse = max(float(self.box_sum(self.sq_sum, x0, y0, x1, y1)) / count, 0.0)
+        mae = max(float(self.box_sum(self.abs_sum, x0, y0, x1, y1)) / count, 0.0)
+        psnr = 10 * math.log10(255.0 ** 2 / mse) if mse > 1e-10 else math.inf
+        return mse, mae, psnr
+
+
+def build_error_tables(gt_arr, arr):
+    # gt_arr / arr: (h, w, 3) uint8, 各通道误差先求和再做积分
+    import cv2
+    diff = np.maximum(arr, gt_arr) - np.minimum(arr, gt_arr)
+    abs_map = diff.sum(axis=2, dtype=np.float32)
+    diff = diff.astype(np.float32)
+    diff *= diff
+    sq_map = diff.sum(axis=2)
+    del diff
+    abs_sum = cv2.integral(abs_map, sdepth=cv2.CV_64F)
+    sq_sum = cv2.integral(sq_map, sdepth=cv2.CV_64F)
+    return ErrorTables(abs_sum, sq_sum, gt_arr.shape[2])
+
+
+class RoiMetrics:
+    # 图像加载后预先计算与真值的误差积分图, 放大镜移动时区域指标为 O(1)
+    # 结果按 (真值路径, 图像路径) 缓存, 大小由 MemoryManager 统一管理
+    def __init__(self, memory_manager):
+        self.memory_manager = memory_manager
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, gt_path, path):
+        with self._lock:
+            tables = self._cache.get((gt_path, path))
+            if tables is not None:
+                self._cache.move_to_end((gt_path, path))
+        if tables is not None:
+            self.memory_manager.touch(tables)
+        return tables
+
+    def put(self, gt_path, path, tables):
+        with self._lock:
+            self._cache[(gt_path, path)] = tables
+            self._cache.move_to_end((gt_path, path))
+        self.memory_manager.register(tables, release=partial(self.remove, gt_path, path))
+
+    def remove(self, gt_path, path):
+        with self._lock:
+            return self._cache.pop((gt_path, path), None)
+
+    def clear(self):
+        with self._lock:
+            tables = list(self._cache.values())
+            self._cache.clear()
+        for table in tables:
+            self.memory_manager.unregister(table)
+
+    def compute(self, gt_path, gt, images):
+        # images: {path: ImagePyramid}, 返回 {path: ErrorTables}, 尺寸与真值不同的图像跳过
+        results = {}
+        gt_image = None
+        for path, image in images.items():
+            tables = self.get(gt_path, path)
+            if tables is None and image is not None and not image.tiled and not gt.tiled \
+                    and image.width() == gt.width() and image.height() == gt.height():
+                if gt_image is None:
+                    gt_image = as_rgb32(gt.level(0))
+                    gt_arr = qimage_to_array(gt_image)[..., :3]
+                method_image = as_rgb32(image.level(0))
+                # 中间数组: 差值 (uint8 x3, float32 x3) 与两张误差图 (float32 x2)
+                pixels = gt.width() * gt.height()
+                with self.memory_manager.transient(pixels * (3 + 12 + 8)), tracer.span('roi.tables'):
+                    tables = build_error_tables(gt_arr, qimage_to_array(method_image)[..., :3])
+                self.put(gt_path, path, tables)
+            if tables is not None:
+                results[path] = tables
+        return results
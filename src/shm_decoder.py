@@ -0,0 +1,113 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from PyQt5.QtGui import *
+import multiprocessing
+import numpy as np
+import threading
+import os
+
+from src.image_io import JPEG_EXTENSIONS, reduced_flags, array_qimage, read_image_size, reduced_factor, split_virtual
+from src.image_pyramid import ImagePyramid
+from src.tracing import tracer
+
+# OpenCV 可以解码的格式, 其余格式 (gif 等) 仍由 QImage 在线程中解码
+SHM_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+
+def decode_to_shm(path, flags):
+    # 工作进程: 解码并转换为 BGRA 直接写入新建的共享内存, 只返回名字与尺寸, 像素不经过 pickle
+    import cv2
+    img = cv2.imread(path, flags)
+    if img is None:
+        return None
+    height, width = img.shape[:2]
+    shm = shared_memory.SharedMemory(create=True, size=height * width * 4)
+    try:
+        out = np.ndarray((height, width, 4), np.uint8, shm.buf)
+        cv2.cvtColor(img, cv2.COLOR_BGR2BGRA, dst=out)
+        del out
+    finally:
+        # 只关闭本进程的映射, 由GUI进程接管并删除
+        shm.close()
+    return shm.name, width, height
+
+
+def warm_up():
+    # 工作进程启动后先导入 OpenCV, 第一次解码不必再等待导入
+    import cv2
+
+
+class SharedBuffer:
+    # GUI进程中映射工作进程写好的共享内存, QImage 直接引用这块内存
+    def __init__(self, name, width, height):
+        self.shm = shared_memory.SharedMemory(name)
+        # 映射已建立, 立即删除名字, 最后一个引用释放时内存随之回收
+        self.shm.unlink()
+        self.array = np.ndarray((height, width, 4), np.uint8, self.shm.buf)
+
+    def __del__(self):
+        # 先释放数组对缓冲的引用, 否则 close 会失败
+        self.array = None
+        self.shm.close()
+
+
+class ShmDecoder:
+    # 进程池解码, 解码不受 GIL 限制, 结果零拷贝包装为 QImage
+    def __init__(self, workers=None):
+        # 每个 spawn 进程都要重新导入 PyQt/numpy/cv2, 默认最多 4 个, 多核机器上也不占用过多内存
+        self.workers = workers or max(1, min(4, (os.cpu_count() or 2) - 1))
+        self.executor = None
+        # 工作进程全部启动前由调用方在线程中解码, 不等待进程启动
+        self.ready = threading.Event()
+
+    def start(self):
+        if self.executor is not None:
+            return
+        # 多线程的GUI进程中 fork 不安全, 使用 spawn 启动工作进程
+        self.executor = ProcessPoolExecutor(max_workers=self.workers,
+                                            mp_context=multiprocessing.get_context('spawn'))
+        warmups = [self.executor.submit(warm_up) for _ in range(self.workers)]
+        remaining = [len(warmups)]
+        lock = threading.Lock()
+
+        def started(future):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0] == 0 and not future.cancelled():
+                    self.ready.set()
+        for future in warmups:
+            future.add_done_callback(started)
+
+    def decode(self, path, width=None, height=None):
+        # 返回 ImagePyramid, 不支持的路径或格式返回 None, 由调用方改用线程内解码
+        if not self.ready.is_set() or split_virtual(path)[1] is not None \
+                or not path.lower().endswith(SHM_EXTENSIONS):
+            return None
+        import cv2
+        flags = cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION
+        full_size = None
+        if width is not None and path.lower().endswith(JPEG_EXTENSIONS):
+            full_size = read_image_size(path)
+            factor = reduced_factor(full_size, width, height)
+            if factor > 1:
+                flags = reduced_flags(factor)
+            else:
+                full_size = None
+        try:
+            # 包括排队等待空闲工作进程的时间
+            with tracer.span('decode.shm', path=path):
+                result = self.executor.submit(decode_to_shm, path, flags).result()
+        except (BrokenProcessPool, RuntimeError, OSError):
+            return None
+        if result is None:
+            return None
+        name, w, h = result
+        buffer = SharedBuffer(name, w, h)
+        image = array_qimage(buffer.array, QImage.Format_RGB32, owner=buffer)
+        return ImagePyramid(image, full_size)
+
+    def shutdown(self):
+        self.ready.clear()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
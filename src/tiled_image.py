@@ -0,0 +1,267 @@
+from PyQt5.QtCore import *
+from PyQt5.QtGui import *
+from collections import OrderedDict
+import numpy as np
+import threading
+import math
+import os
+
+from src.image_io import JPEG_EXTENSIONS, read_image_size, split_virtual
+from src.image_pyramid import ImagePyramid
+
+try:
+    import tifffile
+except ImportError:
+    tifffile = None
+
+try:
+    import zarr
+except ImportError:
+    zarr = None
+
+TILE_SIZE = 512
+OVERVIEW_SIZE = 2048  # 概览图的最长边, 适应窗口显示时只用概览
+TILED_PIXELS = 64 * 1024 * 1024  # 超过此像素数的图像按块读取
+
+
+def array_to_qimage(array, window=None):
+    # (h, w) 灰度, (h, w, 3) RGB 或 (h, w, 4) RGBA
+    # 给定 WindowLevel 时按窗口映射到8位, 否则16位数据取高8位
+    if window is not None:
+        array = window.to_8bit(array)
+    elif array.dtype == np.uint16:
+        array = (array >> 8).astype(np.uint8)
+    elif array.dtype != np.uint8:
+        array = np.clip(array, 0, 255).astype(np.uint8)
+    array = np.ascontiguousarray(array)
+    height, width = array.shape[:2]
+    if array.ndim == 2:
+        fmt = QImage.Format_Grayscale8
+    elif array.shape[2] == 4:
+        fmt = QImage.Format_RGBA8888
+    else:
+        array = np.ascontiguousarray(array[..., :3])
+        fmt = QImage.Format_RGB888
+    image = QImage(array.data, width, height, array.strides[0], fmt)
+    return image.convertToFormat(QImage.Format_RGB32)
+
+
+class ArraySource:
+    # 按区域读取的数组 (np.memmap 或 zarr), 只读取访问到的部分
+    def __init__(self, array, window=None):
+        self.array = array
+        # 非8位数据经窗宽窗位映射
+        self.window = window if array.dtype != np.uint8 else None
+
+    def size(self):
+        return QSize(self.array.shape[1], self.array.shape[0])
+
+    def read(self, x, y, width, height, factor=1):
+        if isinstance(self.array, np.ndarray):
+            region = self.array[y:y + height:factor, x:x + width:factor]
+        else:
+            region = np.asarray(self.array[y:y + height, x:x + width])[::factor, ::factor]
+        if region.size == 0:
+            return None
+        return array_to_qimage(region, self.window)
+
+
+class ReaderSource:
+    # QImageReader 的 ClipRect/ScaledSize, JPEG 插件只解码所需的区域和分辨率
+    def __init__(self, path, size):
+        self.path = path
+        self._size = QSize(size)
+
+    def size(self):
+        return QSize(self._size)
+
+    def read(self, x, y, width, height, factor=1):
+        # QImageReader 不是线程安全的, 每次读取单独创建
+        reader = QImageReader(self.path)
+        reader.setClipRect(QRect(x, y, width, height))
+        if factor > 1:
+            reader.setScaledSize(QSize(max(1, width // factor), max(1, height // factor)))
+        image = reader.read()
+        if image.isNull():
+            return None
+        return image.convertToFormat(QImage.Format_RGB32)
+
+
+def open_tiff(path):
+    # 未压缩的 TIFF 直接映射到内存, 压缩的分块 TIFF 经 zarr 按块解码
+    if tifffile is None:
+        return None
+    try:
+        return tifffile.memmap(path, mode='r')
+    except (ValueError, OSError):
+        pass
+    if zarr is None:
+        return None
+    try:
+        store = zarr.open(tifffile.imread(path, aszarr=True), mode='r')
+    except Exception:
+        return None
+    # 多分辨率 TIFF 打开为组, 第0个数组为原图
+    return store if hasattr(store, 'shape') else store['0']
+
+
+def is_large(shape):
+    return len(shape) >= 2 and shape[0] * shape[1] > TILED_PIXELS
+
+
+def open_tiled_source(path, window=None):
+    # 可按块读取的图像返回数据源, 其余返回 None 走普通的整图解码
+    if split_virtual(path)[1] is not None:
+        # 视频帧与压缩包成员没有可映射的文件
+        return None
+    ext = os.path.splitext(path)[1].lower()
+    # 普通大小的数组走整图解码, 差异图与 ROI 指标不支持分块图像
+    if ext == '.npy':
+        try:
+            array = np.load(path, mmap_mode='r')
+        except (ValueError, OSError):
+            return None
+        return ArraySource(array, window) if is_large(array.shape) else None
+    if ext in ('.tif', '.tiff'):
+        array = open_tiff(path)
+        return ArraySource(array, window) if array is not None and is_large(array.shape) else None
+    if ext in JPEG_EXTENSIONS:
+        size = read_image_size(path)
+        if size.isValid() and is_large((size.height(), size.width())):
+            return ReaderSource(path, size)
+    return None
+
+
+class TileCache:
+    # 所有分块图像共享的LRU块缓存, 用量计入 MemoryManager, 内存紧张时先被裁剪
+    def __init__(self, memory_manager=None, max_bytes=256 * 1024 * 1024):
+        self.memory_manager = memory_manager
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+        if memory_manager is not None:
+            memory_manager.register(self, 0, trim=TileCache.trim)
+
+    def nbytes(self):
+        return self.used_bytes
+
+    def get(self, key, load):
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile is not None:
+                self._tiles.move_to_end(key)
+                return tile
+        tile = load()
+        if tile is None:
+            return None
+        with self._lock:
+            delta = tile.sizeInBytes()
+            old = self._tiles.pop(key, None)
+            if old is not None:
+                delta -= old.sizeInBytes()
+            self._tiles[key] = tile
+            while self.used_bytes + delta > self.max_bytes and len(self._tiles) > 1:
+                _, evicted = self._tiles.popitem(last=False)
+                delta -= evicted.sizeInBytes()
+            self.used_bytes += delta
+        if self.memory_manager is not None:
+            self.memory_manager.adjust(self, delta)
+        return tile
+
+    def trim(self):
+        # 丢弃较旧的一半
+        with self._lock:
+            freed = 0
+            for _ in range(len(self._tiles) // 2 or len(self._tiles)):
+                _, tile = self._tiles.popitem(last=False)
+                freed += tile.sizeInBytes()
+            self.used_bytes -= freed
+        return freed
+
+    def clear(self):
+        with self._lock:
+            freed = self.used_bytes
+            self._tiles.clear()
+            self.used_bytes = 0
+        if self.memory_manager is not None:
+            self.memory_manager.adjust(self, -freed)
+
+
+class TiledImage(ImagePyramid):
+    # 超大图像: 适应窗口的显示使用概览图金字塔, 放大后只读取可见区域的块
+    # 坐标与 ImagePyramid 一致始终为原图像素, 内存与屏幕面积成正比而与原图尺寸无关
+    tiled = True
+
+    def __init__(self, path, source, tile_cache, overview_size=OVERVIEW_SIZE):
+        full_size = source.size()
+        factor = 1
+        while max(full_size.width(), full_size.height()) / factor > overview_size:
+            factor *= 2
+        overview = source.read(0, 0, full_size.width(), full_size.height(), factor)
+        super().__init__(overview, full_size)
+        self.path = path
+        self.source = source
+        self.tile_cache = tile_cache
+        self.overview_factor = factor
+        window = getattr(source, 'window', None)
+        self.window_version = window.version if window is not None else None
+
+    def is_reduced(self):
+        # 原图分辨率的像素随时可按块读取, 不需要整图升级
+        return False
+
+    def covers(self, scale):
+        return True
+
+    def upgrade(self, image):
+        pass
+
+    def apply_window(self):
+        # 重新映射概览图, 旧窗口的块因键不同不再命中, 随 LRU 淘汰
+        window = getattr(self.source, 'window', None)
+        if window is None or window.version == self.window_version:
+            return False
+        self.window_version = window.version
+        overview = self.source.read(0, 0, self.width(), self.height(), self.overview_factor)
+        with self._lock:
+            delta = overview.sizeInBytes() - sum(level.sizeInBytes() for level in self.levels)
+            self.levels = [overview]
+        if self.on_resize is not None:
+            self.on_resize(self, delta)
+        return True
+
+    def tile(self, factor, tx, ty):
+        span = TILE_SIZE * factor
+        x, y = tx * span, ty * span
+        width = min(span, self.width() - x)
+        height = min(span, self.height() - y)
+        return self.tile_cache.get((self.path, self.window_version, factor, tx, ty),
+                                   lambda: self.source.read(x, y, width, height, factor))
+
+    def draw_region(self, painter, target, source):
+        scale = min(target.width() / max(source.width(), 1), target.height() / max(source.height(), 1))
+        if scale <= self.base_scale() * 1.001:
+            super().draw_region(painter, target, source)
+            return
+        # 块的降采样倍数: 分辨率仍不低于输出的最大 2 的幂
+        factor = 2 ** int(math.floor(math.log2(1 / scale))) if scale < 1 else 1
+        span = TILE_SIZE * factor
+        tx0 = max(0, int(source.left() // span))
+        ty0 = max(0, int(source.top() // span))
+        tx1 = min(int(math.ceil(source.right() / span)), int(math.ceil(self.width() / span)))
+        ty1 = min(int(math.ceil(source.bottom() / span)), int(math.ceil(self.height() / span)))
+        fx = target.width() / max(source.width(), 1)
+        fy = target.height() / max(source.height(), 1)
+        painter.save()
+        painter.setClipRect(target, Qt.IntersectClip)
+        for ty in range(ty0, ty1):
+            for tx in range(tx0, tx1):
+                tile = self.tile(factor, tx, ty)
+                if tile is None:
+                    continue
+                dest = QRectF(target.x() + (tx * span - source.x()) * fx,
+                              target.y() + (ty * span - source.y()) * fy,
+                              tile.width() * factor * fx, tile.height() * factor * fy)
+                painter.drawImage(dest, tile, QRectF(tile.rect()))
+        painter.restore()
@@ -0,0 +1,54 @@
+from PyQt5.QtWidgets import *
+from PyQt5.QtGui import *
+from PyQt5.QtCore import *
+
+from src.tracing import tracer
+
+# 叠加层显示的 span, 依次为: 图像切换总延迟, 解码, 缩放, 转换为 QPixmap, 差异图, 放大镜截取, 面板重绘
+OVERLAY_SPANS = ('switch', 'decode', 'decode.shm', 'scale', 'pixmap', 'diff', 'zoom.capture', 'paint')
+
+
+class TraceOverlay(QLabel):
+    # 半透明地覆盖在父部件右上角, 显示最近各阶段的平均/最大耗时, 不接收鼠标事件
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.setStyleSheet("background-color: rgba(0, 0, 0, 160); color: white; padding: 6px;")
+        self.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        parent.installEventFilter(self)
+        # 打开叠加层之前的记录状态, 关闭时恢复 (--trace 或 MULTI_VIEWER_TRACE 开启时保持记录)
+        self.was_enabled = tracer.enabled
+        self.hide()
+
+    def set_active(self, flag):
+        if flag:
+            if not self.isVisible():
+                self.was_enabled = tracer.enabled
+            tracer.enable()
+            self.refresh()
+            self.show()
+            self.raise_()
+            self.timer.start(500)
+        else:
+            self.timer.stop()
+            if self.isVisible():
+                tracer.enable(self.was_enabled)
+            self.hide()
+
+    def refresh(self):
+        lines = []
+        for name in OVERLAY_SPANS:
+            stats = tracer.stats(name)
+            if stats is not None:
+                count, mean, peak = stats
+                lines.append(f"{name:13s} {mean:7.1f} ms  max {peak:7.1f}")
+        self.setText('\n'.join(lines) or "等待数据...")
+        self.adjustSize()
+        self.move(self.parentWidget().width() - self.width() - 8, 8)
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Resize and self.isVisible():
+            self.move(self.parentWidget().width() - self.width() - 8, 8)
+        return False
@@ -0,0 +1,99 @@
+from collections import defaultdict, deque
+import threading
+import json
+import time
+import os
+
+
+class _NullSpan:
+    # 关闭时所有 span 共用的空对象, 开销只有一次属性判断
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.record(self.name, self.start, time.perf_counter(), self.args)
+        return False
+
+
+class Tracer:
+    # 轻量的耗时记录: span 写入有界缓冲, 可导出为 Chrome trace (chrome://tracing, Perfetto)
+    # 同时按名字保留最近的耗时, 供界面上的帧时间/延迟叠加层显示
+    def __init__(self, capacity=200000, recent=120):
+        self.enabled = False
+        self.events = deque(maxlen=capacity)
+        self.recent = defaultdict(lambda: deque(maxlen=recent))
+        self.origin = time.perf_counter()
+        self.thread_names = {}
+        self._lock = threading.Lock()
+
+    def enable(self, flag=True):
+        self.enabled = flag
+
+    def span(self, name, **args):
+        # with tracer.span('decode', path=path): ...
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, args)
+
+    def record(self, name, start, end, args=None):
+        # start/end 为 time.perf_counter(), 也用于跨越多个回调的异步区间
+        if not self.enabled:
+            return
+        thread = threading.current_thread()
+        with self._lock:
+            self.thread_names[thread.ident] = thread.name
+            self.events.append((name, start, end, thread.ident, args))
+            self.recent[name].append(end - start)
+
+    def stats(self, name):
+        # 最近的 (次数, 平均, 最大) 毫秒, 没有记录时返回 None
+        with self._lock:
+            samples = list(self.recent.get(name, ()))
+        if not samples:
+            return None
+        return len(samples), 1000 * sum(samples) / len(samples), 1000 * max(samples)
+
+    def clear(self):
+        with self._lock:
+            self.events.clear()
+            self.recent.clear()
+
+    def export_chrome_trace(self, path):
+        # Trace Event Format 的完整事件 (ph = 'X'), 时间单位为微秒
+        with self._lock:
+            events = list(self.events)
+            thread_names = dict(self.thread_names)
+        pid = os.getpid()
+        trace = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+                 for tid, name in thread_names.items()]
+        for name, start, end, tid, args in events:
+            event = {'name': name, 'cat': name.split('.')[0], 'ph': 'X', 'pid': pid, 'tid': tid,
+                     'ts': (start - self.origin) * 1e6, 'dur': (end - start) * 1e6}
+            if args:
+                event['args'] = {key: str(value) for key, value in args.items()}
+            trace.append(event)
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f)
+        return len(events)
+
+
+# 进程内共享的实例, 设置环境变量 MULTI_VIEWER_TRACE=1 时启动即开启
+tracer = Tracer()
+tracer.enable(os.environ.get('MULTI_VIEWER_TRACE') == '1')
@@ -0,0 +1,76 @@
+import numpy as np
+import threading
+
+from src.image_pyramid import ImagePyramid
+from src.tiled_image import array_to_qimage
+
+
+class WindowLevel:
+    # 16位/浮点图像显示到8位的窗口: 数据的 [low, high] 线性映射到 [0, 255]
+    # low/high 按数据类型的标称范围归一化 (整数为类型最大值, 浮点为 1.0), 所有图像共享同一个窗口
+    def __init__(self, low=0.0, high=1.0):
+        self.low = low
+        self.high = high
+        self.version = 0  # 每次调整加一, 图像据此判断是否需要重新映射
+        self._lut = None
+        self._lut_version = None
+        self._lock = threading.Lock()
+
+    def set_window(self, low, high):
+        self.low = low
+        self.high = max(high, low + 1e-6)
+        self.version += 1
+
+    def level(self):
+        return (self.low + self.high) / 2
+
+    def width(self):
+        return self.high - self.low
+
+    def scale(self, values, max_value=1.0):
+        # 向量化映射, values 为任意数值类型的数组
+        out = np.asarray(values, np.float32) * np.float32(1 / max_value)
+        out -= np.float32(self.low)
+        out *= np.float32(255.0 / (self.high - self.low))
+        np.clip(out, 0, 255, out=out)
+        return out.astype(np.uint8)
+
+    def lut(self):
+        # uint16 的查找表, 每个窗口只计算一次, 之后每个像素只需一次查表
+        with self._lock:
+            if self._lut_version != self.version:
+                self._lut = self.scale(np.arange(65536, dtype=np.float32), 65535.0)
+                self._lut_version = self.version
+            return self._lut
+
+    def to_8bit(self, array):
+        if array.dtype == np.uint8:
+            return array
+        if array.dtype == np.uint16:
+            return np.take(self.lut(), array)
+        if np.issubdtype(array.dtype, np.integer):
+            return self.scale(array, float(np.iinfo(array.dtype).max))
+        return self.scale(array)
+
+
+class HdrImage(ImagePyramid):
+    # 保留原始数据的16位/浮点图像, 第0层是按当前窗口映射的8位图像
+    # 调整窗口时只从原始数据重新映射, 不重新解码
+    def __init__(self, array, window):
+        self.array = array
+        self.window = window
+        self.window_version = window.version
+        super().__init__(array_to_qimage(array, window))
+
+    def nbytes(self):
+        # 内存映射的 .npy 不占用进程内存
+        raw = 0 if isinstance(self.array, np.memmap) else self.array.nbytes
+        return super().nbytes() + raw
+
+    def apply_window(self):
+        version = self.window.version
+        if version == self.window_version:
+            return False
+        self.window_version = version
+        self.upgrade(array_to_qimage(self.array, self.window))
+        return True